@@ -3,13 +3,26 @@ from __future__ import annotations
 from pathlib import Path
 import streamlit as st
 
-from engine.pipeline import build_and_save_index, load_index
-from engine.query_engine import answer_query
-from engine.providers.hf_transformers import hf_is_available
+from engine.providers.hf_transformers import QUANT_MODES, get_llm, hf_is_available
 
 
 st.set_page_config(page_title="Rhythmx Local LLM Query Engine", layout="wide")
 
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def cached_index(index_path: str, mtime: float):
+    # mtime is part of the cache key so a rebuilt index is picked up.
+    from engine.pipeline import load_index
+
+    return load_index(index_path)
+
+
+@st.cache_resource(show_spinner="Loading local model...")
+def preload_llm(model_path: str, quant: str):
+    # Same (path, quant, compile_model) key HFGenerator loads with; the UI never compiles.
+    return get_llm(model_path, quant, False)
+
+
 c1, c2 = st.columns([1, 5], vertical_alignment="center")
 with c1:
     st.image("assets/rhythmx_logo.png", width=200)
@@ -23,22 +36,33 @@ with st.sidebar:
     index_path = st.text_input("Index path", value="artifacts/index.pkl")
     top_k = st.slider("Top-k retrieval", min_value=3, max_value=20, value=8)
     show_context = st.checkbox("Show retrieved context", value=True)
+    use_cache = st.checkbox("Cache answers", value=True, help="Reuse answers for repeated questions (artifacts/cache)")
 
     st.divider()
     use_llm = st.checkbox("Use local LLM for final answer", value=True)
     llm_provider = st.selectbox("LLM provider", options=["hf"], index=0)
     llm_model_path = st.text_input("Local model path", value="models/tinyllama")
-    temperature = st.slider("Temperature", min_value=0.0, max_value=1.0, value=0.2, step=0.05)
+    temperature = st.slider("Temperature", min_value=0.0, max_value=1.0, value=0.2, step=0.05, help="0.3 or lower decodes greedily")
     max_tokens = st.slider("Max output tokens", min_value=128, max_value=2048, value=700, step=64)
+    llm_quant = st.selectbox("Quantization", options=list(QUANT_MODES), index=0, help="int8/bf16 run on CPU; q4/q8 need bitsandbytes and a CUDA GPU")
 
     ok, msg = hf_is_available()
     if ok:
         st.success("Transformers backend available.")
+        if use_llm:
+            try:
+                preload_llm(llm_model_path, llm_quant)
+            except Exception as e:
+                st.warning(f"Could not load local model: {e}")
     else:
         st.warning(f"Transformers backend issue: {msg}")
 
     if st.button("Build/Rebuild index"):
+        from engine.pipeline import build_and_save_index
+
         Path("artifacts").mkdir(exist_ok=True, parents=True)
+        # Drop this session's memory-mapped index so its old sidecars can be removed.
+        cached_index.clear()
         build_and_save_index(data_dir=data_dir, index_path=index_path)
         st.success("Index built.")
 
@@ -47,12 +71,27 @@ q = st.text_input("Question", value="Does the patient have asthma?")
 run = st.button("Run")
 
 if run:
+    # Engine modules (sklearn, numpy, dateutil) load on first use, not on page render.
+    from engine.pipeline import IndexVersionError, build_and_save_index
+    from engine.query_engine import answer_query_stream
+
     if not Path(index_path).exists():
         st.warning("Index not found. Building now...")
         build_and_save_index(data_dir=data_dir, index_path=index_path)
 
-    idx = load_index(index_path)
-    result = answer_query(
+    try:
+        idx = cached_index(index_path, Path(index_path).stat().st_mtime)
+    except IndexVersionError:
+        st.warning("Index was built by an older version. Rebuilding now...")
+        cached_index.clear()
+        build_and_save_index(data_dir=data_dir, index_path=index_path)
+        idx = cached_index(index_path, Path(index_path).stat().st_mtime)
+
+    st.markdown("### Answer")
+    answer_box = st.empty()
+    result = {}
+    streamed = ""
+    for item in answer_query_stream(
         idx,
         q,
         top_k=top_k,
@@ -61,10 +100,17 @@ if run:
         llm_model_path=llm_model_path,
         temperature=temperature,
         max_tokens=max_tokens,
-    )
+        llm_quant=llm_quant,
+        use_cache=use_cache,
+    ):
+        if isinstance(item, dict):
+            result = item
+        else:
+            streamed += item
+            answer_box.markdown(streamed)
 
-    st.markdown("### Answer")
-    st.write(result["answer"])
+    # Guardrails may replace the streamed text with the deterministic answer.
+    answer_box.write(result["answer"])
     st.caption(f"Intent: {result.get('intent')} | Used LLM: {result.get('used_llm')}")
 
     if show_context:
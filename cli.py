@@ -1,21 +1,31 @@
 from __future__ import annotations
 
 import argparse
-import json
 from pathlib import Path
 
-from engine.pipeline import build_and_save_index, load_index
-from engine.query_engine import answer_query
+from engine import jsonio
+from engine.providers.hf_transformers import QUANT_MODES
+
+# engine.pipeline / engine.query_engine pull in sklearn, numpy and dateutil;
+# they are imported inside the commands so `--help` stays fast.
 
 
 def cmd_build_index(args: argparse.Namespace) -> None:
+    from engine.pipeline import build_and_save_index
+
     Path(Path(args.index_path).parent).mkdir(parents=True, exist_ok=True)
     build_and_save_index(data_dir=args.data_dir, index_path=args.index_path)
     print(f"Index saved to: {args.index_path}")
 
 
 def cmd_ask(args: argparse.Namespace) -> None:
-    idx = load_index(args.index_path)
+    from engine.pipeline import IndexVersionError, load_index
+    from engine.query_engine import answer_query
+
+    try:
+        idx = load_index(args.index_path)
+    except IndexVersionError as e:
+        raise SystemExit(str(e)) from None
     out = answer_query(
         idx,
         args.query,
@@ -25,10 +35,13 @@ def cmd_ask(args: argparse.Namespace) -> None:
         llm_model_path=args.llm_model_path,
         temperature=args.temperature,
         max_tokens=args.max_tokens,
+        llm_quant=args.quant,
+        llm_compile=args.compile,
+        use_cache=not args.no_cache,
     )
 
     if args.json:
-        print(json.dumps(out, indent=2))
+        print(jsonio.dumps(out, indent=True))
         return
 
     print(out["answer"])
@@ -39,36 +52,47 @@ def cmd_ask(args: argparse.Namespace) -> None:
 
 
 def cmd_eval(args: argparse.Namespace) -> None:
+    from engine.pipeline import build_and_save_index, load_index
+    from engine.providers.hf_transformers import get_llm
+    from engine.query_engine import answer_query_batch
+
     tmp_index = args.index_path or "artifacts/index_eval.pkl"
     Path("artifacts").mkdir(exist_ok=True, parents=True)
     build_and_save_index(data_dir=args.data_dir, index_path=tmp_index)
     idx = load_index(tmp_index)
 
-    with open(args.questions, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-
-    results = []
-    for q in payload.get("questions", []):
-        results.append(
-            answer_query(
-                idx,
-                q,
-                top_k=args.top_k,
-                use_llm=args.use_llm,
-                llm_provider=args.llm_provider,
-                llm_model_path=args.llm_model_path,
-                temperature=args.temperature,
-                max_tokens=args.max_tokens,
-            )
-        )
+    payload = jsonio.loads(Path(args.questions).read_bytes())
+
+    if args.use_llm and args.llm_provider == "hf":
+        # Load the model once up front; answers fall back to deterministic if this fails.
+        try:
+            get_llm(args.llm_model_path, args.quant, args.compile)
+        except Exception as e:
+            print(f"LLM preload failed, using deterministic answers: {e}")
+
+    results = answer_query_batch(
+        idx,
+        payload.get("questions", []),
+        top_k=args.top_k,
+        use_llm=args.use_llm,
+        llm_provider=args.llm_provider,
+        llm_model_path=args.llm_model_path,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        llm_quant=args.quant,
+        llm_compile=args.compile,
+        batch_size=args.batch_size,
+        max_concurrent_batches=args.max_concurrent_batches,
+        use_cache=not args.no_cache,
+    )
 
     out = {"results": results}
     if args.out:
         with open(args.out, "w", encoding="utf-8") as f:
-            json.dump(out, f, indent=2)
+            f.write(jsonio.dumps(out, indent=True))
         print(f"Wrote: {args.out}")
     else:
-        print(json.dumps(out, indent=2))
+        print(jsonio.dumps(out, indent=True))
 
 
 def main() -> None:
@@ -92,6 +116,9 @@ def main() -> None:
     a.add_argument("--llm-model-path", default="models/tinyllama", help="Local folder path containing model files")
     a.add_argument("--temperature", type=float, default=0.2)
     a.add_argument("--max-tokens", type=int, default=700)
+    a.add_argument("--quant", default="none", choices=list(QUANT_MODES), help="Weight quantization: int8/bf16 on CPU; q4/q8 need bitsandbytes + CUDA")
+    a.add_argument("--compile", action="store_true", help="torch.compile the model with a static KV cache")
+    a.add_argument("--no-cache", action="store_true", help="Ignore and do not update the answer cache")
     a.set_defaults(func=cmd_ask)
 
     e = sub.add_parser("eval")
@@ -106,6 +133,11 @@ def main() -> None:
     e.add_argument("--llm-model-path", default="models/tinyllama", help="Local folder path containing model files")
     e.add_argument("--temperature", type=float, default=0.2)
     e.add_argument("--max-tokens", type=int, default=700)
+    e.add_argument("--quant", default="none", choices=list(QUANT_MODES), help="Weight quantization: int8/bf16 on CPU; q4/q8 need bitsandbytes + CUDA")
+    e.add_argument("--compile", action="store_true", help="torch.compile the model with a static KV cache")
+    e.add_argument("--batch-size", type=int, default=4, help="Prompts decoded together per LLM call")
+    e.add_argument("--max-concurrent-batches", type=int, default=2, help="LLM batches decoded in parallel (1 with --compile)")
+    e.add_argument("--no-cache", action="store_true", help="Ignore and do not update the answer cache")
     e.set_defaults(func=cmd_eval)
 
     args = p.parse_args()
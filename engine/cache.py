@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shelve
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = "artifacts/cache"
+
+# Bump when handler/prompt changes would make previously cached answers stale.
+_CACHE_VERSION = 1
+
+_LOCK = threading.Lock()
+
+
+def make_key(**parts: Any) -> str:
+    """Content-addressed key: sha256 over the (sorted) keyword arguments."""
+    blob = json.dumps({"v": _CACHE_VERSION, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get(key: str, path: str = DEFAULT_CACHE_PATH) -> Optional[Dict[str, Any]]:
+    with _LOCK:
+        try:
+            with shelve.open(path, flag="r") as db:
+                return db.get(key)
+        except Exception:
+            # Missing or unreadable cache is just a miss.
+            return None
+
+
+def put(key: str, value: Dict[str, Any], path: str = DEFAULT_CACHE_PATH) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with _LOCK:
+        try:
+            with shelve.open(path) as db:
+                db[key] = value
+        except Exception:
+            # Caching is best-effort; never fail the query because of it.
+            pass
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+# Helpers for the "system|code|display" codings produced by normalize.py.
+
+_SYSTEM_RE = re.compile(r"(loinc|snomed|icd-?10|icd-?9|rxnorm|cpt)", re.IGNORECASE)
+
+_SYSTEM_LABELS = {
+    "loinc": "LOINC",
+    "snomed": "SNOMED",
+    "icd10": "ICD-10",
+    "icd9": "ICD-9",
+    "rxnorm": "RxNorm",
+    "cpt": "CPT",
+}
+
+
+@lru_cache(maxsize=4096)
+def coding_label(system: str) -> Optional[str]:
+    # Coding systems repeat heavily across records, so the lookup is memoized.
+    if not system:
+        return None
+    m = _SYSTEM_RE.search(system)
+    if not m:
+        return None
+    return _SYSTEM_LABELS[m.group(1).lower().replace("-", "")]
+
+
+@lru_cache(maxsize=8192)
+def parse_coding_triplet(coding: str) -> Tuple[str, str, str]:
+    # Expected format from normalize.py: system|code|display (some parts may be missing)
+    parts = (coding or "").split("|")
+    system = parts[0] if len(parts) > 0 else ""
+    code = parts[1] if len(parts) > 1 else ""
+    display = parts[2] if len(parts) > 2 else ""
+    return system.strip(), code.strip(), display.strip()
+
+
+def extract_code_refs(parsed_codings: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+    out: Dict[str, List[str]] = defaultdict(list)
+    seen: Dict[str, Set[str]] = defaultdict(set)
+    for system, code, _display in parsed_codings or []:
+        if not code:
+            continue
+        label = coding_label(system)
+        if not label:
+            continue
+        if code not in seen[label]:
+            seen[label].add(code)
+            out[label].append(code)
+    return dict(out)
+
+
+def first_code(parsed_codings: List[Tuple[str, str, str]], label: str) -> Optional[str]:
+    # Same as extract_code_refs(...)[label][0], without building the full mapping.
+    for system, code, _display in parsed_codings or []:
+        if code and coding_label(system) == label:
+            return code
+    return None
+
+
+def format_code_refs(parsed_codings: List[Tuple[str, str, str]], prefer: Optional[List[str]] = None) -> str:
+    refs = extract_code_refs(parsed_codings)
+    if not refs:
+        return ""
+    order = prefer or ["ICD-10", "SNOMED", "LOINC", "RxNorm", "CPT", "ICD-9"]
+    parts: List[str] = []
+    for k in order:
+        if k in refs and refs[k]:
+            codes = refs[k][:3]  # keep compact
+            parts.append(f"{k}: {', '.join(codes)}")
+    for k, codes in refs.items():
+        if k in order or not codes:
+            continue
+        parts.append(f"{k}: {', '.join(codes[:3])}")
+    return "; ".join(parts)
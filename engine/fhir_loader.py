@@ -1,9 +1,15 @@
 from __future__ import annotations
 
-import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import jsonio
+
+# Below this many files a worker pool costs more to start than it saves.
+_PARALLEL_MIN_FILES = 16
 
 
 @dataclass
@@ -13,7 +19,7 @@ class FhirResource:
     raw: Dict[str, Any]
 
 
-def load_fhir_dir(data_dir: str) -> List[FhirResource]:
+def load_fhir_dir(data_dir: str, workers: Optional[int] = None) -> List[FhirResource]:
     """
     Load FHIR resources from JSON files in a directory.
 
@@ -22,6 +28,9 @@ def load_fhir_dir(data_dir: str) -> List[FhirResource]:
     - list of resources
     - Bundle with entry[].resource
 
+    Large directories are parsed in a process pool (`workers` processes,
+    default: one per CPU); pass workers=1 to force serial loading.
+
     Failure modes:
     - missing directory -> FileNotFoundError
     - invalid JSON -> json.JSONDecodeError
@@ -30,23 +39,41 @@ def load_fhir_dir(data_dir: str) -> List[FhirResource]:
     if not p.exists():
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
 
+    # Paths are streamed into the pool as the directory is listed; peek just far
+    # enough to decide whether a pool is worth starting.
+    files = p.glob("*.json")
+    head = list(itertools.islice(files, _PARALLEL_MIN_FILES))
+    if workers == 1 or len(head) < _PARALLEL_MIN_FILES:
+        loaded = list(map(_load_one_file_keyed, itertools.chain(head, files)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            loaded = list(ex.map(_load_one_file_keyed, itertools.chain(head, files), chunksize=16))
+
+    # Directory listing order is OS-dependent; restore file-name order so
+    # chunk order (and everything downstream) stays deterministic.
+    loaded.sort(key=lambda t: t[0])
+    return list(itertools.chain.from_iterable(res for _fp, res in loaded))
+
+
+def _load_one_file_keyed(fp: Path) -> Tuple[Path, List[FhirResource]]:
+    return fp, _load_one_file(fp)
+
+
+def _load_one_file(fp: Path) -> List[FhirResource]:
+    obj = jsonio.loads(fp.read_bytes())
+
     resources: List[FhirResource] = []
-    for fp in sorted(p.glob("*.json")):
-        with fp.open("r", encoding="utf-8") as f:
-            obj = json.load(f)
-
-        if isinstance(obj, dict) and obj.get("resourceType") == "Bundle" and isinstance(obj.get("entry"), list):
-            for e in obj["entry"]:
-                if isinstance(e, dict) and isinstance(e.get("resource"), dict):
-                    resources.extend(_parse_item(e["resource"], fallback_file=fp.name))
-            continue
-
-        if isinstance(obj, list):
-            for item in obj:
-                resources.extend(_parse_item(item, fallback_file=fp.name))
-        else:
-            resources.extend(_parse_item(obj, fallback_file=fp.name))
+    if isinstance(obj, dict) and obj.get("resourceType") == "Bundle" and isinstance(obj.get("entry"), list):
+        for e in obj["entry"]:
+            if isinstance(e, dict) and isinstance(e.get("resource"), dict):
+                resources.extend(_parse_item(e["resource"], fallback_file=fp.name))
+        return resources
 
+    if isinstance(obj, list):
+        for item in obj:
+            resources.extend(_parse_item(item, fallback_file=fp.name))
+    else:
+        resources.extend(_parse_item(obj, fallback_file=fp.name))
     return resources
 
 
@@ -1,71 +1,20 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
-from dateutil import parser as dtparser
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 
-from .pipeline import EngineIndex
-
-
-# --- Coding helpers -----------------------------------------------------------
-
-def _coding_label(system: str) -> Optional[str]:
-    if not system:
-        return None
-    s = system.lower().strip()
-    if "loinc" in s or s == "http://loinc.org":
-        return "LOINC"
-    if "snomed" in s or "snomed.info/sct" in s:
-        return "SNOMED"
-    if "icd-10" in s or "icd10" in s:
-        return "ICD-10"
-    if "icd-9" in s or "icd9" in s:
-        return "ICD-9"
-    if "rxnorm" in s or "nlm.nih.gov/research/umls/rxnorm" in s:
-        return "RxNorm"
-    if "cpt" in s:
-        return "CPT"
-    return None
+import numpy as np
 
+from .codes import first_code, format_code_refs, parse_coding_triplet
+from .pipeline import EngineIndex
+from .row_index import RowIndex
 
-def _parse_coding_triplet(coding: str) -> Tuple[str, str, str]:
-    # Expected format from normalize.py: system|code|display (some parts may be missing)
-    parts = (coding or "").split("|")
-    system = parts[0] if len(parts) > 0 else ""
-    code = parts[1] if len(parts) > 1 else ""
-    display = parts[2] if len(parts) > 2 else ""
-    return system.strip(), code.strip(), display.strip()
-
-
-def _extract_code_refs(codings: List[str]) -> Dict[str, List[str]]:
-    out: Dict[str, List[str]] = {}
-    for c in codings or []:
-        system, code, _display = _parse_coding_triplet(c)
-        if not code:
-            continue
-        label = _coding_label(system)
-        if not label:
-            continue
-        out.setdefault(label, [])
-        if code not in out[label]:
-            out[label].append(code)
-    return out
-
-
-def _format_code_refs(codings: List[str], prefer: Optional[List[str]] = None) -> str:
-    refs = _extract_code_refs(codings)
-    if not refs:
-        return ""
-    order = prefer or ["ICD-10", "SNOMED", "LOINC", "RxNorm", "CPT", "ICD-9"]
-    parts: List[str] = []
-    for k in order:
-        if k in refs and refs[k]:
-            codes = refs[k][:3]  # keep compact
-            parts.append(f"{k}: {', '.join(codes)}")
-    for k, codes in refs.items():
-        if k in order or not codes:
-            continue
-        parts.append(f"{k}: {', '.join(codes[:3])}")
-    return "; ".join(parts)
+# Optional multi-pattern matcher; handlers fall back to plain substring loops.
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - depends on environment
+    ahocorasick = None
 
 
 # --- Answer formatting --------------------------------------------------------
@@ -73,23 +22,103 @@ def _format_code_refs(codings: List[str], prefer: Optional[List[str]] = None) ->
 def format_answer(lines: List[str], sources: List[str]) -> str:
     if not lines:
         return "Not found in provided records."
-    uniq = []
-    for s in sources:
-        if s and s not in uniq:
-            uniq.append(s)
+    # Handlers append sources freely; dedupe here, keeping first-seen order.
+    uniq = [s for s in dict.fromkeys(sources) if s]
     return "\n".join(lines + ["", "Source: " + ", ".join(uniq)])
 
 
-def _sort_by_date(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
-    def parse_dt(v: Any) -> float:
-        if not v:
-            return -1.0
-        try:
-            return dtparser.parse(v).timestamp()
-        except Exception:
-            return -1.0
+def _result(facts: List[Dict[str, Any]], lines: List[str], sources: List[str]) -> Dict[str, Any]:
+    # Handler contract: facts, formatted answer, and the sorted distinct fact
+    # sources (the citations the LLM guardrail checks against).
+    return {
+        "facts": facts,
+        "answer": format_answer(lines, sources),
+        "citations": sorted({f["source"] for f in facts}),
+    }
+
+
+def _candidate_positions(ri: RowIndex, needle: str, n_rows: int) -> List[int]:
+    # Row positions (in record order) worth checking for `needle`; all rows if the index can't narrow.
+    cand = ri.candidates(needle)
+    return list(range(n_rows)) if cand is None else sorted(cand)
+
+
+def _keyword_matcher(keyword_groups: List[List[str]]) -> Callable[[str], List[int]]:
+    """
+    Return a function mapping a text to the (sorted) indexes of the groups
+    with at least one keyword occurring in it as a substring.
+
+    Uses a single Aho-Corasick automaton over all keywords when pyahocorasick
+    is installed, so each text is scanned once regardless of group count.
+    """
+    if ahocorasick is None or not any(keyword_groups):
+        def match_loop(text: str) -> List[int]:
+            return [gi for gi, kws in enumerate(keyword_groups) if any(kw in text for kw in kws)]
+
+        return match_loop
+
+    owners: Dict[str, List[int]] = {}
+    for gi, kws in enumerate(keyword_groups):
+        for kw in kws:
+            groups = owners.setdefault(kw, [])
+            if not groups or groups[-1] != gi:
+                groups.append(gi)
+
+    automaton = ahocorasick.Automaton()
+    for kw, groups in owners.items():
+        automaton.add_word(kw, tuple(groups))
+    automaton.make_automaton()
+
+    def match_automaton(text: str) -> List[int]:
+        hit = set()
+        for _end, groups in automaton.iter(text):
+            hit.update(groups)
+        return sorted(hit)
+
+    return match_automaton
+
+
+# --- Keyword matching ---------------------------------------------------------
+
+_WORD_RE = re.compile(r"\w+")
+
+# (single-word keywords, multi-word phrases)
+_KeywordSet = Tuple[FrozenSet[str], Tuple[str, ...]]
+
 
-    return sorted(rows, key=lambda r: parse_dt(r.get(key)), reverse=True)
+def _keyword_set(keywords: Iterable[str]) -> _KeywordSet:
+    # Single words are matched per token; phrases spanning tokens fall back to substring search.
+    kws = list(keywords)
+    words = frozenset(k for k in kws if _WORD_RE.fullmatch(k))
+    return words, tuple(k for k in kws if k not in words)
+
+
+_DIABETES_KW = _keyword_set(["diabetes", "diabetic"])
+
+# Complication keywords (small, explainable list)
+_COMPL_KW = _keyword_set([
+    "neuropathy", "retinopathy", "nephropathy", "kidney", "ckd", "chronic kidney",
+    "ulcer", "foot", "amac", "macular", "microvascular", "macrovascular", "gastroparesis",
+])
+
+_MEDREL_KW = _keyword_set(["penicillin", "sulfon", "drug", "antibiotic", "contrast", "iodin"])
+
+
+@lru_cache(maxsize=16384)
+def _token_has_keyword(token: str, words: FrozenSet[str]) -> bool:
+    # Substring semantics ("sulfon" in "sulfonamide"), computed once per distinct token.
+    return any(w in token for w in words)
+
+
+def _has_keyword(tokens: Iterable[str], text: str, kw: _KeywordSet) -> bool:
+    # Same result as any(k in text for k in keywords) when tokens are the \w+ runs of text.
+    words, phrases = kw
+    if words:
+        if not words.isdisjoint(tokens):
+            return True
+        if any(_token_has_keyword(t, words) for t in tokens):
+            return True
+    return any(p in text for p in phrases)
 
 
 # --- Handlers ----------------------------------------------------------------
@@ -97,24 +126,26 @@ def _sort_by_date(rows: List[Dict[str, Any]], key: str) -> List[Dict[str, Any]]:
 def handle_condition(idx: EngineIndex, entity: str) -> Dict[str, Any]:
     conditions = idx.normalized.conditions
     if not conditions:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
     ent = (entity or "").strip().lower()
-    matches = []
+    ri = idx.row_indexes["conditions"]
+    positions: List[int] = []
 
     if ent:
-        for c in conditions:
+        for i in _candidate_positions(ri, ent, len(conditions)):
+            c = conditions[i]
             name = (c.get("text") or "").lower()
             codes_blob = " ".join(c.get("codings") or []).lower()
             if ent in name or ent in codes_blob:
-                matches.append(c)
+                positions.append(i)
     else:
-        matches = conditions
+        positions = list(range(len(conditions)))
 
-    if not matches:
-        return {"facts": [], "answer": "Not found in provided records."}
+    if not positions:
+        return _result([], [], [])
 
-    matches = _sort_by_date(matches, key="recorded")
+    matches = [conditions[i] for i in ri.newest_first(positions)]
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -122,7 +153,7 @@ def handle_condition(idx: EngineIndex, entity: str) -> Dict[str, Any]:
 
     for c in matches:
         name = c.get("text") or "Unknown condition"
-        refs = _format_code_refs(c.get("codings") or [], prefer=["ICD-10", "SNOMED", "ICD-9"])
+        refs = format_code_refs(c["parsedCodings"], prefer=["ICD-10", "SNOMED", "ICD-9"])
         recorded = c.get("recorded") or c.get("onset") or ""
         line = f"The patient has {name}" if ent else f"Condition: {name}"
         if refs:
@@ -133,33 +164,35 @@ def handle_condition(idx: EngineIndex, entity: str) -> Dict[str, Any]:
         facts.append({"source": c["source"], "text": line})
         sources.append(c["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def handle_medications(idx: EngineIndex, entity: str) -> Dict[str, Any]:
     meds = idx.normalized.medications
     if not meds:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
     ent = (entity or "").strip().lower()
-    filtered: List[Dict[str, Any]] = []
+    ri = idx.row_indexes["medications"]
+    filtered: List[int] = []
 
     # Prefer reason-based match
     if ent:
-        for m in meds:
-            if ent in (m.get("reason") or "").lower():
-                filtered.append(m)
+        cand = _candidate_positions(ri, ent, len(meds))
+        for i in cand:
+            if ent in (meds[i].get("reason") or "").lower():
+                filtered.append(i)
 
         # fallback: match medication text
         if not filtered:
-            for m in meds:
-                if ent in (m.get("text") or "").lower():
-                    filtered.append(m)
+            for i in cand:
+                if ent in (meds[i].get("text") or "").lower():
+                    filtered.append(i)
 
-    use_list = filtered if filtered else meds
+    positions = filtered if filtered else list(range(len(meds)))
     # Prefer active/current first
-    use_list = [m for m in use_list if (m.get("status") or "").lower() not in {"stopped", "entered-in-error"}] or use_list
-    use_list = _sort_by_date(use_list, key="effective")
+    positions = [i for i in positions if (meds[i].get("status") or "").lower() not in {"stopped", "entered-in-error"}] or positions
+    use_list = [meds[i] for i in ri.newest_first(positions)]
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -167,7 +200,7 @@ def handle_medications(idx: EngineIndex, entity: str) -> Dict[str, Any]:
 
     for m in use_list:
         name = m.get("text") or "Unknown medication"
-        refs = _format_code_refs(m.get("codings") or [], prefer=["RxNorm", "SNOMED"])
+        refs = format_code_refs(m["parsedCodings"], prefer=["RxNorm", "SNOMED"])
         dt = m.get("effective") or ""
         dose = m.get("dosageText") or ""
         reason = m.get("reason") or ""
@@ -184,13 +217,13 @@ def handle_medications(idx: EngineIndex, entity: str) -> Dict[str, Any]:
         facts.append({"source": m["source"], "text": line})
         sources.append(m["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def handle_allergies(idx: EngineIndex) -> Dict[str, Any]:
     alls = idx.normalized.allergies
     if not alls:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -198,7 +231,7 @@ def handle_allergies(idx: EngineIndex) -> Dict[str, Any]:
 
     for a in alls:
         name = a.get("text") or "Unknown allergen"
-        refs = _format_code_refs(a.get("codings") or [], prefer=["SNOMED", "RxNorm"])
+        refs = format_code_refs(a["parsedCodings"], prefer=["SNOMED", "RxNorm"])
         reactions = a.get("reactions") or ""
         line = f"Allergy: {name}"
         if refs:
@@ -209,7 +242,7 @@ def handle_allergies(idx: EngineIndex) -> Dict[str, Any]:
         facts.append({"source": a["source"], "text": line})
         sources.append(a["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
@@ -220,7 +253,7 @@ def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
     current_med_sources = [m.get("source") for m in current_meds if m.get("source")]
 
     if not alls:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
     # Basic allergen -> keyword mapping (conservative, demo-friendly)
     allergen_keywords = {
@@ -237,13 +270,13 @@ def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
     for a in alls:
         a_name = (a.get("text") or "").strip()
         a_lower = a_name.lower()
-        refs = _format_code_refs(a.get("codings") or [], prefer=["SNOMED", "RxNorm"])
+        refs = format_code_refs(a["parsedCodings"], prefer=["SNOMED", "RxNorm"])
         reactions = a.get("reactions") or ""
         if not a_name:
             continue
 
         # Decide if this is medication-related
-        is_med_related = any(k in a_lower for k in ["penicillin", "sulfon", "drug", "antibiotic", "contrast", "iodin"])
+        is_med_related = _has_keyword(a["nameTokens"], a_lower, _MEDREL_KW)
         if not is_med_related:
             # Still include as allergy fact, but not a medication avoidance recommendation
             line = f"Allergy: {a_name}"
@@ -269,32 +302,35 @@ def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
     matched_lines: List[str] = []
     matched_sources: List[str] = []
     if meds:
-        for m in meds:
-            med_name = (m.get("text") or "").lower()
-            if not med_name:
-                continue
-            for a in alls:
-                a_name = (a.get("text") or "").lower()
-                if not a_name:
-                    continue
-                keys = []
+        # Keywords per allergy: mapped allergen-class terms plus the allergy name itself.
+        allergy_keys: List[List[str]] = []
+        for a in alls:
+            a_name = (a.get("text") or "").lower()
+            keys: List[str] = []
+            if a_name:
                 for k, kws in allergen_keywords.items():
                     if k in a_name:
                         keys.extend(kws)
-                # Also include direct allergy name token
                 keys.append(a_name)
+            allergy_keys.append([kw for kw in keys if kw])
 
-                if any(kw and kw in med_name for kw in keys):
-                    med_refs = _format_code_refs(m.get("codings") or [], prefer=["RxNorm", "SNOMED"])
-                    alg_refs = _format_code_refs(a.get("codings") or [], prefer=["SNOMED", "RxNorm"])
-                    line = f"Avoid {m.get('text') or 'this medication'}"
-                    if med_refs:
-                        line += f" ({med_refs})"
-                    line += f" due to allergy to {a.get('text') or 'recorded allergen'}"
-                    if alg_refs:
-                        line += f" ({alg_refs})"
-                    matched_lines.append(line)
-                    matched_sources.extend([m["source"], a["source"]])
+        match_allergies = _keyword_matcher(allergy_keys)
+        for m in meds:
+            med_name = (m.get("text") or "").lower()
+            if not med_name:
+                continue
+            for ai in match_allergies(med_name):
+                a = alls[ai]
+                med_refs = format_code_refs(m["parsedCodings"], prefer=["RxNorm", "SNOMED"])
+                alg_refs = format_code_refs(a["parsedCodings"], prefer=["SNOMED", "RxNorm"])
+                line = f"Avoid {m.get('text') or 'this medication'}"
+                if med_refs:
+                    line += f" ({med_refs})"
+                line += f" due to allergy to {a.get('text') or 'recorded allergen'}"
+                if alg_refs:
+                    line += f" ({alg_refs})"
+                matched_lines.append(line)
+                matched_sources.extend([m["source"], a["source"]])
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -309,7 +345,7 @@ def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
                 lines.append(f["text"])
         facts = [{"source": s, "text": t} for s, t in zip(matched_sources, matched_lines)] + allergy_facts
         sources = matched_sources + sources
-        return {"facts": facts, "answer": format_answer(lines, sources)}
+        return _result(facts, lines, sources)
 
     # No direct conflicts found
     if not avoid_recs:
@@ -327,14 +363,14 @@ def handle_avoid_due_to_allergies(idx: EngineIndex) -> Dict[str, Any]:
     # Add current medications to citations for the "no conflicts" conclusion
     sources.extend([s for s in current_med_sources if s])
     facts = [{"source": f["source"], "text": f["text"]} for f in allergy_facts]
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def _is_abnormal(interpretation_text: str, interpretation_codings: List[str]) -> Optional[str]:
     # Returns a short label like "High" / "Low" / "Abnormal" / "Normal"
     codes = []
     for c in interpretation_codings or []:
-        _sys, code, display = _parse_coding_triplet(c)
+        _sys, code, display = parse_coding_triplet(c)
         if code:
             codes.append(code.upper())
         if display:
@@ -361,50 +397,49 @@ def _is_abnormal(interpretation_text: str, interpretation_codings: List[str]) ->
 def handle_labs(idx: EngineIndex, query_text: str) -> Dict[str, Any]:
     obs = idx.normalized.observations
     if not obs:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
     q = (query_text or "").lower()
     # Common lab terms to help narrow results
     target_terms = ["hba1c", "a1c", "hemoglobin a1c", "creatinine", "egfr", "bun", "urea", "renal", "kidney", "cholesterol", "glucose", "blood pressure", "bmi"]
     want_terms = [t for t in target_terms if t in q]
 
-    obs_use = obs
+    ri = idx.row_indexes["observations"]
+    positions = list(range(len(obs)))
     if want_terms:
-        cand = []
-        for o in obs:
+        want_kw = _keyword_set(want_terms)
+        cand = set()
+        for t in want_terms:
+            cand.update(_candidate_positions(ri, t, len(obs)))
+        positions = []
+        for i in sorted(cand):
+            o = obs[i]
             name = (o.get("text") or "").lower()
+            if _has_keyword(o["nameTokens"], name, want_kw):
+                positions.append(i)
+                continue
             codes = " ".join(o.get("codings") or []).lower()
-            if any(t in name for t in want_terms) or any(t in codes for t in want_terms):
-                cand.append(o)
-        obs_use = cand
+            if any(t in codes for t in want_terms):
+                positions.append(i)
 
-    if not obs_use:
-        return {"facts": [], "answer": "Not found in provided records."}
+    if not positions:
+        return _result([], [], [])
 
     # Group by LOINC code if available (preferred), else by test name.
-    def obs_ts(o: Dict[str, Any]) -> float:
-        dt = o.get("effective") or o.get("issued")
-        if not dt:
-            return -1.0
-        try:
-            return dtparser.parse(dt).timestamp()
-        except Exception:
-            return -1.0
-
-    best_by_key: Dict[str, Dict[str, Any]] = {}
-    for o in obs_use:
-        codings = o.get("codings") or []
-        refs = _extract_code_refs(codings)
-        loinc_code = (refs.get("LOINC") or [None])[0]
+    # One pass keeps the newest row per key; timestamps are read once as Python ints.
+    best_by_key: Dict[str, Tuple[int, int]] = {}
+    for i, t in zip(positions, ri.timestamps[positions].tolist()):
+        o = obs[i]
+        loinc_code = first_code(o["parsedCodings"], "LOINC")
         key = f"LOINC:{loinc_code}" if loinc_code else f"NAME:{(o.get('text') or '').lower()}"
-        ts = obs_ts(o)
         prev = best_by_key.get(key)
-        if prev is None or ts > obs_ts(prev):
-            best_by_key[key] = o
+        if prev is None or t > prev[1]:
+            best_by_key[key] = (i, t)
 
-    selected = list(best_by_key.values())
-    selected.sort(key=obs_ts, reverse=True)
-    selected = selected[: min(10, len(selected))]
+    picked = np.fromiter((i for i, _t in best_by_key.values()), dtype=np.int64, count=len(best_by_key))
+    picked_ts = np.fromiter((t for _i, t in best_by_key.values()), dtype=np.int64, count=len(best_by_key))
+    picked = picked[np.argsort(-picked_ts, kind="stable")]
+    selected = [obs[int(i)] for i in picked[:10]]
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -414,7 +449,7 @@ def handle_labs(idx: EngineIndex, query_text: str) -> Dict[str, Any]:
         test = o.get("text") or "Unknown test"
         value = o.get("value") or ""
         dt = o.get("effective") or o.get("issued") or ""
-        loinc = _format_code_refs(o.get("codings") or [], prefer=["LOINC"])
+        loinc = format_code_refs(o["parsedCodings"], prefer=["LOINC"])
         interp_label = _is_abnormal(o.get("interpretation") or "", o.get("interpretationCodings") or [])
         line = f"The most recent {test}"
         if loinc:
@@ -433,47 +468,40 @@ def handle_labs(idx: EngineIndex, query_text: str) -> Dict[str, Any]:
         facts.append({"source": o["source"], "text": line})
         sources.append(o["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def handle_diabetes_complications(idx: EngineIndex) -> Dict[str, Any]:
     conditions = idx.normalized.conditions or []
     if not conditions:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
-    diabetes_markers = ["diabetes", "diabetic"]
     icd_diabetes_prefixes = ("E10", "E11", "E13")  # common diabetes codes
+    ri = idx.row_indexes["conditions"]
 
-    def is_diabetes(c: Dict[str, Any]) -> bool:
-        name = (c.get("text") or "").lower()
-        if any(m in name for m in diabetes_markers):
-            return True
-        refs = _extract_code_refs(c.get("codings") or [])
-        icd = refs.get("ICD-10") or []
-        return any(code.upper().startswith(icd_diabetes_prefixes) for code in icd)
-
-    has_diabetes = any(is_diabetes(c) for c in conditions)
-
-    # Complication keywords (small, explainable list)
-    complication_keywords = [
-        "neuropathy", "retinopathy", "nephropathy", "kidney", "ckd", "chronic kidney",
-        "ulcer", "foot", "amac", "macular", "microvascular", "macrovascular", "gastroparesis",
-    ]
-
-    complications: List[Dict[str, Any]] = []
-    for c in conditions:
-        name = (c.get("text") or "").lower()
-        if any(m in name for m in diabetes_markers):
-            # "diabetic nephropathy" etc counts as complication
-            complications.append(c)
-            continue
-        if has_diabetes and any(k in name for k in complication_keywords):
-            complications.append(c)
+    def matches(i: int, kw: _KeywordSet) -> bool:
+        c = conditions[i]
+        return _has_keyword(c["nameTokens"], (c.get("text") or "").lower(), kw)
+
+    def keyword_candidates(kw: _KeywordSet) -> List[int]:
+        words, phrases = kw
+        cand = set()
+        for k in (*words, *phrases):
+            cand.update(_candidate_positions(ri, k, len(conditions)))
+        return sorted(cand)
+
+    # "diabetic nephropathy" etc counts as complication
+    marker_rows = {i for i in keyword_candidates(_DIABETES_KW) if matches(i, _DIABETES_KW)}
+    has_diabetes = bool(marker_rows) or bool(ri.icd10_rows(icd_diabetes_prefixes))
+
+    positions = set(marker_rows)
+    if has_diabetes:
+        positions.update(i for i in keyword_candidates(_COMPL_KW) if matches(i, _COMPL_KW))
 
-    if not complications:
-        return {"facts": [], "answer": "Not found in provided records."}
+    if not positions:
+        return _result([], [], [])
 
-    complications = _sort_by_date(complications, key="recorded")
+    complications = [conditions[i] for i in ri.newest_first(sorted(positions))]
 
     lines: List[str] = []
     facts: List[Dict[str, Any]] = []
@@ -481,7 +509,7 @@ def handle_diabetes_complications(idx: EngineIndex) -> Dict[str, Any]:
 
     for c in complications:
         name = c.get("text") or "Unknown condition"
-        refs = _format_code_refs(c.get("codings") or [], prefer=["ICD-10", "SNOMED"])
+        refs = format_code_refs(c["parsedCodings"], prefer=["ICD-10", "SNOMED"])
         recorded = c.get("recorded") or c.get("onset") or ""
         line = f"Diabetes-related complication: {name}"
         if refs:
@@ -492,15 +520,16 @@ def handle_diabetes_complications(idx: EngineIndex) -> Dict[str, Any]:
         facts.append({"source": c["source"], "text": line})
         sources.append(c["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
 
 
 def handle_encounters(idx: EngineIndex) -> Dict[str, Any]:
     enc = idx.normalized.encounters
     if not enc:
-        return {"facts": [], "answer": "Not found in provided records."}
+        return _result([], [], [])
 
-    enc_sorted = _sort_by_date(enc, key="start")
+    ri = idx.row_indexes["encounters"]
+    enc_sorted = [enc[i] for i in ri.newest_first(range(len(enc)))]
     last_two = enc_sorted[:2] if enc_sorted else enc[:2]
 
     lines: List[str] = []
@@ -518,4 +547,4 @@ def handle_encounters(idx: EngineIndex) -> Dict[str, Any]:
         facts.append({"source": e["source"], "text": line})
         sources.append(e["source"])
 
-    return {"facts": facts, "answer": format_answer(lines, sources)}
+    return _result(facts, lines, sources)
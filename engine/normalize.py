@@ -1,101 +1,200 @@
 from __future__ import annotations
 
+import re
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
-from dateutil import parser as dtparser
 
 from .types import Chunk, Normalized
 from .fhir_loader import FhirResource
 
+_TOKEN_RE = re.compile(r"\w+")
 
-def normalize(resources: List[FhirResource]) -> Normalized:
-    conditions: List[Dict[str, Any]] = []
-    medications: List[Dict[str, Any]] = []
-    observations: List[Dict[str, Any]] = []
-    allergies: List[Dict[str, Any]] = []
-    encounters: List[Dict[str, Any]] = []
-    chunks: List[Chunk] = []
+# Date-times that datetime.isoformat() would return unchanged (seconds precision,
+# optional "+HH:MM" offset; "-00:00" is rewritten as "+00:00" so it is excluded);
+# _best_date passes these through without parsing.
+_ISO_CANONICAL_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\+\d{2}:[0-5]\d|-(?!00:00)\d{2}:[0-5]\d)?")
 
-    for r in resources:
-        source = f"{r.resource_type}/{r.resource_id}"
-        raw = r.raw
 
-        if r.resource_type == "Condition":
-            row = {
-                "source": source,
-                "text": _best_text(raw.get("code")),
-                "codings": _all_codings(raw.get("code")),
-                "onset": _best_date(raw.get("onsetDateTime")),
-                "recorded": _best_date(raw.get("recordedDate")),
-                "clinicalStatus": _best_text(raw.get("clinicalStatus")),
-                "verificationStatus": _best_text(raw.get("verificationStatus")),
-            }
-            conditions.append(row)
-            chunks.append(Chunk(source=source, text=_chunk_text_condition(row), meta=row))
-
-        elif r.resource_type in ("MedicationStatement", "MedicationRequest"):
-            row = _normalize_medication(r.resource_type, source, raw)
-            medications.append(row)
-            chunks.append(Chunk(source=source, text=_chunk_text_med(row), meta=row))
-
-        elif r.resource_type == "Observation":
-            interp_txt, interp_codings = _interpretation(raw.get("interpretation"))
-            row = {
-                "source": source,
-                "text": _best_text(raw.get("code")),
-                "codings": _all_codings(raw.get("code")),
-                "value": _obs_value(raw),
-                "effective": _best_date(raw.get("effectiveDateTime") or (raw.get("period") or {}).get("start")),
-                "issued": _best_date(raw.get("issued")),
-                "status": raw.get("status"),
-                "interpretation": interp_txt,
-                "interpretationCodings": interp_codings,
-            }
-            observations.append(row)
-            chunks.append(Chunk(source=source, text=_chunk_text_obs(row), meta=row))
-
-        elif r.resource_type == "AllergyIntolerance":
-            row = {
-                "source": source,
-                "text": _best_text(raw.get("code")),
-                "codings": _all_codings(raw.get("code")),
-                "criticality": raw.get("criticality"),
-                "clinicalStatus": _best_text(raw.get("clinicalStatus")),
-                "verificationStatus": _best_text(raw.get("verificationStatus")),
-                "category": raw.get("category") or [],
-                "reactions": _reactions(raw.get("reaction")),
-            }
-            allergies.append(row)
-            chunks.append(Chunk(source=source, text=_chunk_text_allergy(row), meta=row))
-
-        elif r.resource_type == "Encounter":
-            period = raw.get("period") or {}
-            row = {
-                "source": source,
-                "type": _best_text((raw.get("type") or [{}])[0] if isinstance(raw.get("type"), list) else raw.get("type")),
-                "reason": _best_text((raw.get("reasonCode") or [{}])[0] if isinstance(raw.get("reasonCode"), list) else raw.get("reasonCode")),
-                "start": _best_date(period.get("start")),
-                "end": _best_date(period.get("end")),
-                "status": raw.get("status"),
-            }
-            encounters.append(row)
-            chunks.append(Chunk(source=source, text=_chunk_text_encounter(row), meta=row))
-
-        else:
-            # Fallback: still index as generic chunk for recall.
-            txt = _best_text(raw.get("text")) or raw.get("resourceType", "")
-            chunks.append(Chunk(source=source, text=f"Resource: {source}\n{txt}", meta={"source": source}))
+# Which Normalized table each FHIR resource type feeds; anything else becomes a
+# generic fallback chunk.
+_TABLE_BY_TYPE = {
+    "Condition": "conditions",
+    "MedicationStatement": "medications",
+    "MedicationRequest": "medications",
+    "Observation": "observations",
+    "AllergyIntolerance": "allergies",
+    "Encounter": "encounters",
+}
+
+
+def normalize(resources: List[FhirResource]) -> Normalized:
+    # Bucket by table first so each table is built in its own tight loop; the
+    # positions let chunks keep the original resource order.
+    buckets: Dict[str, List[Tuple[int, FhirResource]]] = defaultdict(list)
+    for pos, r in enumerate(resources):
+        buckets[_TABLE_BY_TYPE.get(r.resource_type, "other")].append((pos, r))
+
+    chunks: List[Optional[Chunk]] = [None] * len(resources)
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+    for table, build in _TABLE_BUILDERS.items():
+        items = buckets.get(table, [])
+        rows, table_chunks = build(items)
+        tables[table] = rows
+        for (pos, _r), chunk in zip(items, table_chunks):
+            chunks[pos] = chunk
+
+    other = buckets.get("other", [])
+    for (pos, _r), chunk in zip(other, _fallback_chunks(other)):
+        chunks[pos] = chunk
+
+    # Lowercased word tokens of each record name, for handler keyword checks.
+    for table in ("conditions", "medications", "observations", "allergies"):
+        for row in tables[table]:
+            row["nameTokens"] = frozenset(_TOKEN_RE.findall((row.get("text") or "").lower()))
 
     return Normalized(
-        conditions=conditions,
-        medications=medications,
-        observations=observations,
-        allergies=allergies,
-        encounters=encounters,
+        conditions=tables["conditions"],
+        medications=tables["medications"],
+        observations=tables["observations"],
+        allergies=tables["allergies"],
+        encounters=tables["encounters"],
         chunks=chunks,
     )
 
 
 # --- Normalizers --------------------------------------------------------------
+# Each takes the (position, resource) pairs of one table and returns its rows
+# and chunks, aligned with the input.
+
+_Built = Tuple[List[Dict[str, Any]], List[Chunk]]
+
+
+def _normalize_conditions(items: List[Tuple[int, FhirResource]]) -> _Built:
+    bt, bd, ct, jc = _best_text, _best_date, _coding_triplets, _join_codings
+    rows: List[Dict[str, Any]] = []
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        raw = r.raw
+        code_triplets = ct(raw.get("code"))
+        row = {
+            "source": source,
+            "text": bt(raw.get("code")),
+            "codings": jc(code_triplets),
+            "parsedCodings": code_triplets,
+            "onset": bd(raw.get("onsetDateTime")),
+            "recorded": bd(raw.get("recordedDate")),
+            "clinicalStatus": bt(raw.get("clinicalStatus")),
+            "verificationStatus": bt(raw.get("verificationStatus")),
+        }
+        rows.append(row)
+        chunks.append(Chunk(source=source, text=_chunk_text_condition(row), meta=row))
+    return rows, chunks
+
+
+def _normalize_medications(items: List[Tuple[int, FhirResource]]) -> _Built:
+    nm = _normalize_medication
+    rows: List[Dict[str, Any]] = []
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        row = nm(r.resource_type, source, r.raw)
+        rows.append(row)
+        chunks.append(Chunk(source=source, text=_chunk_text_med(row), meta=row))
+    return rows, chunks
+
+
+def _normalize_observations(items: List[Tuple[int, FhirResource]]) -> _Built:
+    bt, bd, ct, jc = _best_text, _best_date, _coding_triplets, _join_codings
+    rows: List[Dict[str, Any]] = []
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        raw = r.raw
+        interp_txt, interp_codings = _interpretation(raw.get("interpretation"))
+        code_triplets = ct(raw.get("code"))
+        row = {
+            "source": source,
+            "text": bt(raw.get("code")),
+            "codings": jc(code_triplets),
+            "parsedCodings": code_triplets,
+            "value": _obs_value(raw),
+            "effective": bd(raw.get("effectiveDateTime") or (raw.get("period") or {}).get("start")),
+            "issued": bd(raw.get("issued")),
+            "status": raw.get("status"),
+            "interpretation": interp_txt,
+            "interpretationCodings": interp_codings,
+        }
+        rows.append(row)
+        chunks.append(Chunk(source=source, text=_chunk_text_obs(row), meta=row))
+    return rows, chunks
+
+
+def _normalize_allergies(items: List[Tuple[int, FhirResource]]) -> _Built:
+    bt, ct, jc = _best_text, _coding_triplets, _join_codings
+    rows: List[Dict[str, Any]] = []
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        raw = r.raw
+        code_triplets = ct(raw.get("code"))
+        row = {
+            "source": source,
+            "text": bt(raw.get("code")),
+            "codings": jc(code_triplets),
+            "parsedCodings": code_triplets,
+            "criticality": raw.get("criticality"),
+            "clinicalStatus": bt(raw.get("clinicalStatus")),
+            "verificationStatus": bt(raw.get("verificationStatus")),
+            "category": raw.get("category") or [],
+            "reactions": _reactions(raw.get("reaction")),
+        }
+        rows.append(row)
+        chunks.append(Chunk(source=source, text=_chunk_text_allergy(row), meta=row))
+    return rows, chunks
+
+
+def _normalize_encounters(items: List[Tuple[int, FhirResource]]) -> _Built:
+    bt, bd = _best_text, _best_date
+    rows: List[Dict[str, Any]] = []
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        raw = r.raw
+        period = raw.get("period") or {}
+        row = {
+            "source": source,
+            "type": bt(_first_or(raw.get("type"))),
+            "reason": bt(_first_or(raw.get("reasonCode"))),
+            "start": bd(period.get("start")),
+            "end": bd(period.get("end")),
+            "status": raw.get("status"),
+        }
+        rows.append(row)
+        chunks.append(Chunk(source=source, text=_chunk_text_encounter(row), meta=row))
+    return rows, chunks
+
+
+def _fallback_chunks(items: List[Tuple[int, FhirResource]]) -> List[Chunk]:
+    # Fallback: still index as generic chunk for recall.
+    chunks: List[Chunk] = []
+    for _pos, r in items:
+        source = f"{r.resource_type}/{r.resource_id}"
+        txt = _best_text(r.raw.get("text")) or r.raw.get("resourceType", "")
+        chunks.append(Chunk(source=source, text=f"Resource: {source}\n{txt}", meta={"source": source}))
+    return chunks
+
+
+_TABLE_BUILDERS = {
+    "conditions": _normalize_conditions,
+    "medications": _normalize_medications,
+    "observations": _normalize_observations,
+    "allergies": _normalize_allergies,
+    "encounters": _normalize_encounters,
+}
+
 
 def _normalize_medication(resource_type: str, source: str, raw: Dict[str, Any]) -> Dict[str, Any]:
     # MedicationStatement fields
@@ -107,29 +206,33 @@ def _normalize_medication(resource_type: str, source: str, raw: Dict[str, Any])
         if not eff:
             eff = raw.get("dateAsserted")
 
+        med_triplets = _coding_triplets(raw.get("medicationCodeableConcept"))
         return {
             "source": source,
             "resourceType": resource_type,
             "text": _best_text(raw.get("medicationCodeableConcept")),
-            "codings": _all_codings(raw.get("medicationCodeableConcept")),
+            "codings": _join_codings(med_triplets),
+            "parsedCodings": med_triplets,
             "status": raw.get("status"),
             "effective": _best_date(eff),
             "dosageText": _dosage_text(raw.get("dosage")),
-            "reason": _best_text((raw.get("reasonCode") or [{}])[0] if isinstance(raw.get("reasonCode"), list) else raw.get("reasonCode")),
+            "reason": _best_text(_first_or(raw.get("reasonCode"))),
         }
 
     # MedicationRequest fields
     med_cc = raw.get("medicationCodeableConcept")
     authored = raw.get("authoredOn") or raw.get("dateWritten")
+    med_triplets = _coding_triplets(med_cc)
     return {
         "source": source,
         "resourceType": resource_type,
         "text": _best_text(med_cc),
-        "codings": _all_codings(med_cc),
+        "codings": _join_codings(med_triplets),
+        "parsedCodings": med_triplets,
         "status": raw.get("status") or raw.get("intent"),
         "effective": _best_date(authored),
         "dosageText": _dosage_instruction_text(raw.get("dosageInstruction")),
-        "reason": _best_text((raw.get("reasonCode") or [{}])[0] if isinstance(raw.get("reasonCode"), list) else raw.get("reasonCode")),
+        "reason": _best_text(_first_or(raw.get("reasonCode"))),
     }
 
 
@@ -258,98 +361,127 @@ def _dosage_text(dosage: Any) -> str:
 
 
 # --- Chunk builders -----------------------------------------------------------
+# Rows come from the _normalize_* builders, so every key below is present.
 
 def _chunk_text_condition(row: Dict[str, Any]) -> str:
-    return "\n".join([
-        f"Resource: {row['source']}",
-        f"Condition: {row.get('text','')}",
-        f"Codings: {', '.join(row.get('codings', []))}",
-        f"Onset: {row.get('onset')}",
-        f"Recorded: {row.get('recorded')}",
-        f"ClinicalStatus: {row.get('clinicalStatus')}",
-        f"VerificationStatus: {row.get('verificationStatus')}",
-    ])
+    return (
+        f"Resource: {row['source']}\n"
+        f"Condition: {row['text']}\n"
+        f"Codings: {', '.join(row['codings'])}\n"
+        f"Onset: {row['onset']}\n"
+        f"Recorded: {row['recorded']}\n"
+        f"ClinicalStatus: {row['clinicalStatus']}\n"
+        f"VerificationStatus: {row['verificationStatus']}"
+    )
 
 
 def _chunk_text_med(row: Dict[str, Any]) -> str:
-    return "\n".join([
-        f"Resource: {row['source']}",
-        f"Medication: {row.get('text','')}",
-        f"Codings: {', '.join(row.get('codings', []))}",
-        f"Status: {row.get('status')}",
-        f"Effective: {row.get('effective')}",
-        f"Dosage: {row.get('dosageText')}",
-        f"Reason: {row.get('reason')}",
-    ])
+    return (
+        f"Resource: {row['source']}\n"
+        f"Medication: {row['text']}\n"
+        f"Codings: {', '.join(row['codings'])}\n"
+        f"Status: {row['status']}\n"
+        f"Effective: {row['effective']}\n"
+        f"Dosage: {row['dosageText']}\n"
+        f"Reason: {row['reason']}"
+    )
 
 
 def _chunk_text_obs(row: Dict[str, Any]) -> str:
-    return "\n".join([
-        f"Resource: {row['source']}",
-        f"Observation: {row.get('text','')}",
-        f"Codings: {', '.join(row.get('codings', []))}",
-        f"Value: {row.get('value')}",
-        f"Interpretation: {row.get('interpretation')}",
-        f"InterpretationCodings: {', '.join(row.get('interpretationCodings', []))}",
-        f"Effective: {row.get('effective')}",
-        f"Issued: {row.get('issued')}",
-        f"Status: {row.get('status')}",
-    ])
+    return (
+        f"Resource: {row['source']}\n"
+        f"Observation: {row['text']}\n"
+        f"Codings: {', '.join(row['codings'])}\n"
+        f"Value: {row['value']}\n"
+        f"Interpretation: {row['interpretation']}\n"
+        f"InterpretationCodings: {', '.join(row['interpretationCodings'])}\n"
+        f"Effective: {row['effective']}\n"
+        f"Issued: {row['issued']}\n"
+        f"Status: {row['status']}"
+    )
 
 
 def _chunk_text_allergy(row: Dict[str, Any]) -> str:
-    return "\n".join([
-        f"Resource: {row['source']}",
-        f"Allergy: {row.get('text','')}",
-        f"Codings: {', '.join(row.get('codings', []))}",
-        f"Criticality: {row.get('criticality')}",
-        f"ClinicalStatus: {row.get('clinicalStatus')}",
-        f"VerificationStatus: {row.get('verificationStatus')}",
-        f"Category: {', '.join(row.get('category', [])) if isinstance(row.get('category'), list) else row.get('category')}",
-        f"Reactions: {row.get('reactions')}",
-    ])
+    category = row["category"]
+    return (
+        f"Resource: {row['source']}\n"
+        f"Allergy: {row['text']}\n"
+        f"Codings: {', '.join(row['codings'])}\n"
+        f"Criticality: {row['criticality']}\n"
+        f"ClinicalStatus: {row['clinicalStatus']}\n"
+        f"VerificationStatus: {row['verificationStatus']}\n"
+        f"Category: {', '.join(category) if isinstance(category, list) else category}\n"
+        f"Reactions: {row['reactions']}"
+    )
 
 
 def _chunk_text_encounter(row: Dict[str, Any]) -> str:
-    return "\n".join([
-        f"Resource: {row['source']}",
-        f"EncounterType: {row.get('type','')}",
-        f"Reason: {row.get('reason','')}",
-        f"Start: {row.get('start')}",
-        f"End: {row.get('end')}",
-        f"Status: {row.get('status')}",
-    ])
+    return (
+        f"Resource: {row['source']}\n"
+        f"EncounterType: {row['type']}\n"
+        f"Reason: {row['reason']}\n"
+        f"Start: {row['start']}\n"
+        f"End: {row['end']}\n"
+        f"Status: {row['status']}"
+    )
 
 
 # --- Generic helpers ----------------------------------------------------------
 
 def _all_codings(cc: Any) -> List[str]:
-    # Extract codings from CodeableConcept-like objects: {coding:[{system,code,display}], text:...}
-    if not isinstance(cc, dict):
+    return _join_codings(_coding_triplets(cc))
+
+
+def _coding_triplets(cc: Any) -> List[Tuple[str, str, str]]:
+    # Extract (system, code, display) from CodeableConcept-like objects: {coding:[{system,code,display}], text:...}
+    # EAFP: FHIR JSON is nearly always well-shaped, so skip isinstance checks on the happy path.
+    try:
+        codings = cc.get("coding") or ()
+    except AttributeError:
         return []
-    codings = cc.get("coding") or []
-    out: List[str] = []
-    if isinstance(codings, list):
+    out: List[Tuple[str, str, str]] = []
+    try:
         for c in codings:
-            if not isinstance(c, dict):
+            try:
+                get = c.get
+            except AttributeError:
                 continue
-            system = str(c.get("system") or "").strip()
-            code = str(c.get("code") or "").strip()
-            display = str(c.get("display") or "").strip()
+            system = str(get("system") or "").strip()
+            code = str(get("code") or "").strip()
+            display = str(get("display") or "").strip()
             if system or code or display:
-                out.append(f"{system}|{code}|{display}")
+                out.append((system, code, display))
+    except TypeError:
+        return []
     return out
 
 
+def _join_codings(triplets: List[Tuple[str, str, str]]) -> List[str]:
+    # Flat "system|code|display" strings, as shown in chunks and parsed by older indexes.
+    return [f"{system}|{code}|{display}" for system, code, display in triplets]
+
+
+def _first_or(value: Any) -> Any:
+    # First element of a FHIR repeating field (e.g. reasonCode, type), or the value itself.
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
 def _best_text(cc: Any) -> str:
-    if isinstance(cc, dict):
-        if isinstance(cc.get("text"), str) and cc.get("text").strip():
-            return cc.get("text").strip()
-        codings = cc.get("coding")
-        if isinstance(codings, list) and codings:
-            display = codings[0].get("display")
-            if isinstance(display, str) and display.strip():
-                return display.strip()
+    try:
+        text = cc.get("text")
+        if isinstance(text, str):
+            text = text.strip()
+            if text:
+                return text
+        display = cc["coding"][0].get("display")
+        if isinstance(display, str):
+            display = display.strip()
+            if display:
+                return display
+    except (AttributeError, KeyError, TypeError, IndexError):
+        pass
     if isinstance(cc, str):
         return cc.strip()
     return ""
@@ -358,9 +490,25 @@ def _best_text(cc: Any) -> str:
 def _best_date(value: Any) -> str:
     if not value:
         return ""
-    if isinstance(value, str):
-        try:
-            return dtparser.parse(value).isoformat()
-        except Exception:
-            return value
-    return str(value)
+    if not isinstance(value, str):
+        return str(value)
+    if _ISO_CANONICAL_RE.fullmatch(value):
+        # Already in the exact form isoformat() produces; nothing to normalize.
+        return value
+    return _parse_date_cached(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_cached(value: str) -> str:
+    # FHIR dates are almost always ISO-8601, and the same strings recur across
+    # resources; dateutil is only needed for partial or unusual formats.
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        pass
+    from dateutil import parser as dtparser
+
+    try:
+        return dtparser.parse(value).isoformat()
+    except Exception:
+        return value
@@ -1,33 +1,142 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import pickle
-from dataclasses import dataclass
+import uuid
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from scipy import sparse
 
 from .fhir_loader import load_fhir_dir
 from .normalize import normalize
 from .retrieval import build_hybrid_tfidf, HybridTfidfIndex
-from .types import Normalized
+from .row_index import RowIndex, build_row_indexes
+from .types import Chunk, Normalized
+
+
+# Bump whenever the pickled layout or the sidecar files change; indexes saved
+# with another version must be rebuilt.
+INDEX_FORMAT_VERSION = 1
+
+
+class IndexVersionError(ValueError):
+    """The saved index was written by an incompatible version of the engine."""
 
 
 @dataclass
 class EngineIndex:
     normalized: Normalized
     retrieval: HybridTfidfIndex
+    # Hash of the indexed content; identical data always yields the same value.
+    fingerprint: str = ""
+    # Per-table token/code/date lookups for handlers (see row_index.py).
+    row_indexes: Dict[str, RowIndex] = field(default_factory=dict)
+    # Tag in the sidecar file names of this build (see build_and_save_index).
+    build_id: str = ""
+    # Pickles from before versioning unpickle with this class default (0).
+    format_version: int = 0
 
 
 def build_index(data_dir: str) -> EngineIndex:
     resources = load_fhir_dir(data_dir)
     norm = normalize(resources)
     retrieval = build_hybrid_tfidf(norm.chunks)
-    return EngineIndex(normalized=norm, retrieval=retrieval)
+    return EngineIndex(
+        normalized=norm,
+        retrieval=retrieval,
+        fingerprint=_fingerprint(norm.chunks),
+        row_indexes=build_row_indexes(norm),
+        format_version=INDEX_FORMAT_VERSION,
+    )
+
+
+# The sparse retrieval matrix and IDF rows are stored as .npy files (CSR data/indices/indptr
+# plus shape) next to the index pickle and memory-mapped on load, so only the
+# small metadata goes through pickle.
+_MATRIX_FIELDS = ("mat", "idf_word", "idf_char")
+_CSR_PARTS = ("data", "indices", "indptr")
+_BUILD_ID_LEN = 12
+
+
+def _array_path(index_path: str, build_id: str, name: str) -> Path:
+    p = Path(index_path)
+    return p.with_name(f"{p.stem}.{build_id}.{name}.npy")
 
 
 def build_and_save_index(data_dir: str, index_path: str) -> None:
+    """
+    Build and save an index. Every build writes its sidecars under a fresh
+    build id and then swaps the pickle in atomically, so files that a loaded
+    index still has memory-mapped are never overwritten or truncated (Windows
+    refuses to, POSIX readers could crash).
+    """
     idx = build_index(data_dir)
-    with open(index_path, "wb") as f:
-        pickle.dump(idx, f)
+    idx.build_id = uuid.uuid4().hex[:_BUILD_ID_LEN]
+    for name in _MATRIX_FIELDS:
+        M = getattr(idx.retrieval, name)
+        for part in _CSR_PARTS:
+            np.save(_array_path(index_path, idx.build_id, f"{name}.{part}"), getattr(M, part))
+        np.save(_array_path(index_path, idx.build_id, f"{name}.shape"), np.asarray(M.shape, dtype=np.int64))
+
+    meta = replace(idx, retrieval=replace(idx.retrieval, **{n: None for n in _MATRIX_FIELDS}))
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(meta, f, protocol=5)
+    os.replace(tmp_path, index_path)
+    _remove_stale_sidecars(index_path, idx.build_id)
+
+
+def _remove_stale_sidecars(index_path: str, keep_build_id: str) -> None:
+    p = Path(index_path)
+    for f in p.parent.glob(f"{p.stem}.*.npy"):
+        build_id = f.name[len(p.stem) + 1 :].split(".", 1)[0]
+        if len(build_id) != _BUILD_ID_LEN or build_id == keep_build_id:
+            continue
+        try:
+            f.unlink()
+        except OSError:
+            # Still mapped by a running process (Windows); a later rebuild retries.
+            pass
 
 
 def load_index(index_path: str) -> EngineIndex:
-    with open(index_path, "rb") as f:
-        return pickle.load(f)
+    """Load a saved index; raises IndexVersionError if it must be rebuilt."""
+    rebuild = f"Rebuild it with: python cli.py build-index --data-dir <data> --index-path {index_path}"
+    try:
+        with open(index_path, "rb") as f:
+            idx = pickle.load(f)
+    except (AttributeError, ImportError) as e:
+        # Classes or modules referenced by an old pickle no longer exist.
+        raise IndexVersionError(f"Index {index_path} is from an incompatible version ({e}). {rebuild}") from e
+
+    version = getattr(idx, "format_version", 0)
+    if version != INDEX_FORMAT_VERSION:
+        raise IndexVersionError(
+            f"Index {index_path} has format version {version}, expected {INDEX_FORMAT_VERSION}. {rebuild}"
+        )
+
+    for name in _MATRIX_FIELDS:
+        setattr(idx.retrieval, name, _load_csr(index_path, idx.build_id, name))
+    return idx
+
+
+def _load_csr(index_path: str, build_id: str, name: str) -> sparse.csr_matrix:
+    data, indices, indptr = (
+        np.load(_array_path(index_path, build_id, f"{name}.{part}"), mmap_mode="r") for part in _CSR_PARTS
+    )
+    shape = tuple(int(n) for n in np.load(_array_path(index_path, build_id, f"{name}.shape")))
+    return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def _fingerprint(chunks: List[Chunk]) -> str:
+    h = hashlib.sha256()
+    for c in chunks:
+        h.update(c.source.encode("utf-8"))
+        h.update(b"\0")
+        h.update(c.text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
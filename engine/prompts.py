@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 
 SYSTEM_INSTRUCTIONS = """You are a careful clinical assistant.
@@ -16,13 +16,21 @@ Follow these rules strictly:
 
 
 def build_prompt(question: str, facts: List[Dict[str, Any]], retrieved: List[Dict[str, Any]]) -> str:
+    return "".join(build_prompt_parts(question, facts, retrieved))
+
+
+def build_prompt_parts(question: str, facts: List[Dict[str, Any]], retrieved: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    Split the prompt into (fixed prefix, per-query suffix). The prefix is the
+    same for every query, so providers can tokenize it once and reuse it.
+    """
     # Facts are already formatted as clinical statements with codes.
     facts_block = "\n".join([f"- {f['text']} (Source: {f['source']})" for f in facts]) if facts else "(none)"
 
     # Context remains as evidence; sources are embedded in the chunk header.
     ctx_block = "\n\n".join([f"[Source: {r['source']}]\n{r['text']}" for r in retrieved]) if retrieved else "(none)"
 
-    return f"""{SYSTEM_INSTRUCTIONS}
+    return SYSTEM_INSTRUCTIONS, f"""
 
 QUESTION:
 {question}
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
 
 def hf_is_available() -> Tuple[bool, str]:
     try:
@@ -13,53 +15,260 @@ def hf_is_available() -> Tuple[bool, str]:
         return False, str(e)
 
 
-@lru_cache(maxsize=2)
-def _load_model(model_path: str):
+# Weight quantization modes:
+# - int8 / bf16 run on CPU (dynamic int8 Linear layers / bfloat16 weights)
+# - q4 / q8 load through bitsandbytes (needs a CUDA GPU)
+QUANT_MODES = ("none", "int8", "bf16", "q4", "q8")
+_BNB_QUANT_MODES = ("q4", "q8")
+
+
+def _cpu_has_fast_bf16() -> bool:
+    # bf16 matmuls are only faster than fp32 with native bf16 instructions
+    # (AVX512_BF16 / AMX); plain AVX-512 CPUs emulate them and are slower.
+    import torch
+
+    try:
+        return bool(torch.cpu._is_avx512_bf16_supported() or torch.cpu._is_amx_tile_supported())
+    except Exception:
+        return False
+
+
+def get_llm(model_path: str, quant: str = "none", compile_model: bool = False):
     """
-    Load model/tokenizer from a local folder path.
-    Uses CPU by default for Windows-friendly runs.
+    Load (tokenizer, model) from a local folder path and keep it resident.
+    Call once at startup to avoid paying the cold start on the first query.
+    Uses CPU by default for Windows-friendly runs; bitsandbytes-quantized
+    models are placed by accelerate (device_map="auto"). bf16 falls back to
+    float32 on CPUs without fast bf16 support. With compile_model the forward
+    pass is wrapped in torch.compile (first generation pays the compile cost).
     """
+    # lru_cache keys on how arguments are passed (get_llm(p, q) and
+    # get_llm(p, q, False) would load two models); normalize to one form.
+    return _load_llm(str(model_path), quant, bool(compile_model))
+
+
+@lru_cache(maxsize=2)
+def _load_llm(model_path: str, quant: str, compile_model: bool):
     import torch
     from transformers import AutoModelForCausalLM, AutoTokenizer
 
+    if quant not in QUANT_MODES:
+        raise ValueError(f"Unknown quant mode: {quant!r} (expected one of {QUANT_MODES})")
+
     tok = AutoTokenizer.from_pretrained(model_path, local_files_only=True, use_fast=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        local_files_only=True,
-        torch_dtype=torch.float32,
-        device_map={"": "cpu"},
-    )
+    # Decoder-only models must be left-padded for batched generation.
+    tok.padding_side = "left"
+    if tok.pad_token is None:
+        tok.pad_token = tok.eos_token
+
+    if quant not in _BNB_QUANT_MODES:
+        dtype = torch.bfloat16 if quant == "bf16" and _cpu_has_fast_bf16() else torch.float32
+        load_kwargs: Dict[str, Any] = {"torch_dtype": dtype, "device_map": {"": "cpu"}}
+    else:
+        from transformers import BitsAndBytesConfig
+
+        if quant == "q4":
+            qcfg = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4",
+            )
+        else:
+            qcfg = BitsAndBytesConfig(load_in_8bit=True)
+        load_kwargs = {"quantization_config": qcfg, "device_map": "auto"}
+
+    model = AutoModelForCausalLM.from_pretrained(model_path, local_files_only=True, **load_kwargs)
     model.eval()
+    if quant == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if compile_model:
+        # Compile forward only so model.generate() keeps working unchanged.
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
     return tok, model
 
 
+# At or below this temperature generation is greedy (no sampling).
+_GREEDY_MAX_TEMPERATURE = 0.3
+
+
+@lru_cache(maxsize=8)
+def _prefix_ids(model_path: str, quant: str, compile_model: bool, prefix: str) -> Any:
+    # Token ids (with BOS) of a fixed prompt prefix, computed once per model.
+    tok, _model = get_llm(model_path, quant, compile_model)
+    return tok(prefix, return_tensors="pt")["input_ids"]
+
+
+# Encoded in front of the per-query suffix and then dropped, so the suffix is
+# tokenized in the same left context as inside the full prompt (prefixes from
+# prompts.build_prompt_parts end with a newline). Encoded on its own, the
+# suffix would get an extra leading "▁" token from SentencePiece tokenizers
+# such as Llama's.
+_SUFFIX_ANCHOR = "\n"
+
+
+@lru_cache(maxsize=2)
+def _anchor_len(model_path: str, quant: str, compile_model: bool) -> int:
+    tok, _model = get_llm(model_path, quant, compile_model)
+    return len(tok(_SUFFIX_ANCHOR, add_special_tokens=False)["input_ids"])
+
+
+# (model_path, quant, compile_model, prefix) -> whether cached prefix ids plus
+# anchored suffix ids matched the full-prompt encoding on first use.
+_SPLIT_MATCHES: Dict[Tuple[str, str, bool, str], bool] = {}
+
+
 @dataclass
 class HFGenerator:
     model_path: str
     temperature: float = 0.2
     max_tokens: int = 700
+    quant: str = "none"
+    compile_model: bool = False
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "max_new_tokens": int(self.max_tokens),
+            "num_beams": 1,
+            "use_cache": True,
+        }
+        if self.temperature > _GREEDY_MAX_TEMPERATURE:
+            kwargs["do_sample"] = True
+            kwargs["temperature"] = float(self.temperature)
+        else:
+            # Low temperatures are effectively deterministic; greedy is cheaper per token.
+            kwargs["do_sample"] = False
+        if self.compile_model:
+            # Preallocated KV cache (prompt + max_new_tokens) keeps shapes fixed for the compiled graph.
+            kwargs["cache_implementation"] = "static"
+        return kwargs
+
+    def _llm(self) -> Tuple[Any, Any]:
+        return get_llm(self.model_path, self.quant, self.compile_model)
+
+    def _encode(self, prompt: str, prefix: str) -> Tuple[Any, Any]:
+        """
+        input_ids/attention_mask for prefix + prompt, identical to encoding the
+        whole string. The prefix tokens are cached; the first call per prefix
+        also encodes the full prompt and keeps using the split only if both
+        give the same ids. The text around the split is fixed (the suffix
+        always starts with the QUESTION header), so one check covers every prompt.
+        """
+        import torch
+
+        tok, model = self._llm()
+        key = (self.model_path, self.quant, self.compile_model, prefix)
+        if not prefix or _SPLIT_MATCHES.get(key) is False:
+            input_ids = tok(prefix + prompt, return_tensors="pt")["input_ids"]
+        else:
+            pre = _prefix_ids(*key)
+            anchored = tok(_SUFFIX_ANCHOR + prompt, add_special_tokens=False, return_tensors="pt")["input_ids"]
+            input_ids = torch.cat([pre, anchored[:, _anchor_len(*key[:3]):]], dim=1)
+            if key not in _SPLIT_MATCHES:
+                full = tok(prefix + prompt, return_tensors="pt")["input_ids"]
+                _SPLIT_MATCHES[key] = torch.equal(input_ids, full)
+                input_ids = full
+        input_ids = input_ids.to(model.device)
+        return input_ids, torch.ones_like(input_ids)
+
+    def generate(self, prompt: str, prefix: str = "") -> str:
+        """
+        Complete prefix + prompt. A fixed `prefix` (see
+        prompts.build_prompt_parts) is tokenized once and reused.
+        """
+        import torch
+
+        tok, model = self._llm()
+        input_ids, attention_mask = self._encode(prompt, prefix)
+        with torch.inference_mode():
+            out = model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                pad_token_id=tok.pad_token_id,
+                **self._generation_kwargs(),
+            )
+        return tok.decode(out[0][input_ids.shape[1]:], skip_special_tokens=True).strip()
 
-    def generate(self, prompt: str) -> str:
+    def stream(self, prompt: str, prefix: str = "") -> Iterator[str]:
+        """Yield decoded text pieces as they are generated (prompt not included)."""
         import torch
-        from transformers import TextGenerationPipeline
-
-        tok, model = _load_model(self.model_path)
-
-        pipe = TextGenerationPipeline(
-            model=model,
-            tokenizer=tok,
-            device=-1,  # CPU
-        )
-
-        # Some chat models expect special formatting; for simplicity we provide plain prompt.
-        out = pipe(
-            prompt,
-            do_sample=True if self.temperature > 0 else False,
-            temperature=float(self.temperature),
-            max_new_tokens=int(self.max_tokens),
-            return_full_text=False,
-        )
-        if not out:
-            return ""
-        text = out[0].get("generated_text") or ""
-        return str(text).strip()
+        from transformers import TextIteratorStreamer
+
+        tok, model = self._llm()
+        input_ids, attention_mask = self._encode(prompt, prefix)
+        streamer = TextIteratorStreamer(tok, skip_prompt=True, skip_special_tokens=True)
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            try:
+                with torch.inference_mode():
+                    model.generate(
+                        input_ids=input_ids,
+                        attention_mask=attention_mask,
+                        streamer=streamer,
+                        pad_token_id=tok.pad_token_id,
+                        **self._generation_kwargs(),
+                    )
+            except BaseException as e:
+                errors.append(e)
+                streamer.end()  # unblock the consumer
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            for piece in streamer:
+                if piece:
+                    yield piece
+        finally:
+            worker.join()
+        if errors:
+            raise errors[0]
+
+    def generate_batch(self, prompts: List[str], batch_size: int = 4, max_concurrent_batches: int = 1) -> List[str]:
+        """
+        Generate one completion per prompt, decoding `batch_size` prompts together.
+
+        Up to `max_concurrent_batches` batches are decoded at once so a single
+        long generation does not stall the remaining prompts. Output order
+        matches `prompts`. With compile_model, batches run one at a time.
+        """
+        if not prompts:
+            return []
+
+        tok, _model = self._llm()
+        size = max(1, int(batch_size))
+        batches = [prompts[i : i + size] for i in range(0, len(prompts), size)]
+
+        # Fast tokenizers are not safe to call from several threads; encode up front.
+        encoded = [tok(b, padding=True, return_tensors="pt") for b in batches]
+
+        workers = max(1, min(int(max_concurrent_batches), len(encoded)))
+        if self.compile_model:
+            # The static KV cache lives on the model and is reset by every
+            # generate(), and reduce-overhead graphs are not thread-safe.
+            workers = 1
+        if workers == 1:
+            outputs = [self._generate_encoded(enc) for enc in encoded]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                outputs = list(ex.map(self._generate_encoded, encoded))
+
+        texts: List[str] = []
+        for enc, out in zip(encoded, outputs):
+            prompt_len = enc["input_ids"].shape[1]
+            for seq in out:
+                texts.append(tok.decode(seq[prompt_len:], skip_special_tokens=True).strip())
+        return texts
+
+    def _generate_encoded(self, enc: Any) -> Any:
+        import torch
+
+        tok, model = self._llm()
+        enc = enc.to(model.device)
+        with torch.inference_mode():
+            return model.generate(
+                input_ids=enc["input_ids"],
+                attention_mask=enc["attention_mask"],
+                num_return_sequences=1,
+                pad_token_id=tok.pad_token_id,
+                **self._generation_kwargs(),
+            )
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import re
-from typing import Any, Dict, List
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+from . import cache
 from .pipeline import EngineIndex
 from .query_router import route
 from .handlers import (
@@ -14,9 +16,41 @@ from .handlers import (
     handle_diabetes_complications,
     handle_encounters,
 )
-from .prompts import build_prompt
+from .prompts import build_prompt, build_prompt_parts
+from .types import Chunk
 from .providers.hf_transformers import HFGenerator
 
+# FHIR "ResourceType/id" references cited in LLM output.
+_CITATION_RE = re.compile(r"[A-Za-z]+/[A-Za-z0-9\-\.]+")
+
+
+@dataclass(frozen=True)
+class _LLMSettings:
+    """
+    LLM options shared by the answer_query* entry points. If generation
+    raises, they return the deterministic result without caching it, so the
+    LLM is retried on the next call.
+    """
+
+    enabled: bool
+    provider: str
+    model_path: str
+    temperature: float
+    max_tokens: int
+    quant: str
+    compile_model: bool
+
+    def generator(self) -> HFGenerator:
+        if self.provider != "hf":
+            raise ValueError("Only llm_provider='hf' is supported in this build.")
+        return HFGenerator(
+            model_path=self.model_path,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            quant=self.quant,
+            compile_model=self.compile_model,
+        )
+
 
 def answer_query(
     idx: EngineIndex,
@@ -27,79 +61,201 @@ def answer_query(
     llm_model_path: str = "models/tinyllama",
     temperature: float = 0.2,
     max_tokens: int = 700,
+    llm_quant: str = "none",
+    llm_compile: bool = False,
+    use_cache: bool = False,
 ) -> Dict[str, Any]:
+    llm = _LLMSettings(use_llm, llm_provider, llm_model_path, temperature, max_tokens, llm_quant, llm_compile)
+    key, cached = _cache_lookup(idx, query, top_k, llm, use_cache)
+    if cached is not None:
+        return cached
+
+    result, facts = _deterministic_result(idx, query, top_k)
+
+    if llm.enabled:
+        gen = llm.generator()
+        prefix, prompt = build_prompt_parts(query, facts=facts, retrieved=result["retrieved"])
+        try:
+            _apply_llm_answer(result, gen.generate(prompt, prefix=prefix))
+        except Exception:
+            return result
+
+    if key:
+        cache.put(key, result)
+    return result
+
+
+def answer_query_stream(
+    idx: EngineIndex,
+    query: str,
+    top_k: int = 8,
+    use_llm: bool = False,
+    llm_provider: str = "hf",
+    llm_model_path: str = "models/tinyllama",
+    temperature: float = 0.2,
+    max_tokens: int = 700,
+    llm_quant: str = "none",
+    llm_compile: bool = False,
+    use_cache: bool = False,
+) -> Iterator[Union[str, Dict[str, Any]]]:
+    """
+    Streaming variant of answer_query for interactive use.
+
+    Yields LLM text pieces (str) as they are decoded, then the result dict
+    (same shape as answer_query) as the last item. Guardrails run on the
+    full text, so the final answer may replace what was streamed.
+    """
+    llm = _LLMSettings(use_llm, llm_provider, llm_model_path, temperature, max_tokens, llm_quant, llm_compile)
+    key, cached = _cache_lookup(idx, query, top_k, llm, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    result, facts = _deterministic_result(idx, query, top_k)
+
+    if llm.enabled:
+        gen = llm.generator()
+        prefix, prompt = build_prompt_parts(query, facts=facts, retrieved=result["retrieved"])
+        pieces: List[str] = []
+        try:
+            for piece in gen.stream(prompt, prefix=prefix):
+                pieces.append(piece)
+                yield piece
+            _apply_llm_answer(result, "".join(pieces).strip())
+        except Exception:
+            yield result
+            return
+
+    if key:
+        cache.put(key, result)
+    yield result
+
+
+def answer_query_batch(
+    idx: EngineIndex,
+    queries: List[str],
+    top_k: int = 8,
+    use_llm: bool = False,
+    llm_provider: str = "hf",
+    llm_model_path: str = "models/tinyllama",
+    temperature: float = 0.2,
+    max_tokens: int = 700,
+    llm_quant: str = "none",
+    llm_compile: bool = False,
+    batch_size: int = 4,
+    max_concurrent_batches: int = 2,
+    use_cache: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Answer many queries at once. Retrieval and handlers run per query; the
+    LLM sees all prompts together so decoding is batched instead of serial.
+    Cached answers are reused and only the misses are generated.
+    """
+    llm = _LLMSettings(use_llm, llm_provider, llm_model_path, temperature, max_tokens, llm_quant, llm_compile)
+    lookups = [_cache_lookup(idx, q, top_k, llm, use_cache) for q in queries]
+    keys = [key for key, _cached in lookups]
+    out: List[Any] = [cached for _key, cached in lookups]
+
+    misses = [i for i, r in enumerate(out) if r is None]
+    all_hits = idx.retrieval.search_batch([queries[i] for i in misses], top_k=top_k)
+    prepared = [_deterministic_result(idx, queries[i], top_k, hits) for i, hits in zip(misses, all_hits)]
+    results = [r for r, _facts in prepared]
+
+    if llm.enabled and prepared:
+        gen = llm.generator()
+        prompts = [build_prompt(r["question"], facts=facts, retrieved=r["retrieved"]) for r, facts in prepared]
+        try:
+            texts = gen.generate_batch(prompts, batch_size=batch_size, max_concurrent_batches=max_concurrent_batches)
+        except Exception:
+            # One failure falls the whole batch back.
+            texts = []
+            keys = [""] * len(queries)
+
+        for result, llm_text in zip(results, texts):
+            _apply_llm_answer(result, llm_text)
+
+    for i, result in zip(misses, results):
+        out[i] = result
+        if keys[i]:
+            cache.put(keys[i], result)
+    return out
+
+
+def _cache_lookup(
+    idx: EngineIndex, query: str, top_k: int, llm: _LLMSettings, use_cache: bool
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    # (key, cached result or None); the key is "" when caching is off.
+    if not (use_cache and idx.fingerprint):
+        return "", None
+    key = cache.make_key(
+        index=idx.fingerprint,
+        query=query,
+        top_k=top_k,
+        use_llm=llm.enabled,
+        llm_provider=llm.provider,
+        llm_model_path=llm.model_path,
+        temperature=llm.temperature,
+        max_tokens=llm.max_tokens,
+        llm_quant=llm.quant,
+    )
+    return key, cache.get(key)
+
+
+def _deterministic_result(
+    idx: EngineIndex,
+    query: str,
+    top_k: int,
+    hits: Optional[List[Tuple[Chunk, float]]] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     rq = route(query)
 
-    hits = idx.retrieval.search(query, top_k=top_k)
+    if hits is None:
+        hits = idx.retrieval.search(query, top_k=top_k)
     retrieved = [{"source": c.source, "score": float(score), "text": c.text} for c, score in hits]
 
-    facts: List[Dict[str, Any]] = []
-    deterministic_answer = ""
-
     if rq.intent == "condition":
         out = handle_condition(idx, rq.entity)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "medication":
         out = handle_medications(idx, rq.entity)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "allergy":
         out = handle_allergies(idx)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "avoid_allergies":
         out = handle_avoid_due_to_allergies(idx)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "diabetes_complications":
         out = handle_diabetes_complications(idx)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "labs":
         out = handle_labs(idx, query)
-        facts, deterministic_answer = out["facts"], out["answer"]
     elif rq.intent == "encounter":
         out = handle_encounters(idx)
-        facts, deterministic_answer = out["facts"], out["answer"]
     else:
-        facts, deterministic_answer = [], "Not found in provided records."
-
-    det_citations = sorted({f["source"] for f in facts}) if facts else []
-
-    used_llm = False
-    final_answer = deterministic_answer
-
-    if use_llm:
-        if llm_provider != "hf":
-            raise ValueError("Only llm_provider='hf' is supported in this build.")
+        out = {"facts": [], "answer": "Not found in provided records.", "citations": []}
 
-        prompt = build_prompt(query, facts=facts, retrieved=retrieved)
-
-        try:
-            gen = HFGenerator(model_path=llm_model_path, temperature=temperature, max_tokens=max_tokens)
-            llm_text = gen.generate(prompt)
-
-            # Guardrails:
-            # 1) Must include a Source: line with at least one FHIR resource id
-            # 2) Must not introduce new/unknown FHIR ids (reduce hallucinated citations)
-            if llm_text and "Source:" in llm_text:
-                cited_set = set(re.findall(r"[A-Za-z]+/[A-Za-z0-9\-\.]+", llm_text))
-                if cited_set:
-                    if det_citations:
-                        if cited_set.issubset(set(det_citations)):
-                            final_answer = llm_text
-                            used_llm = True
-                    else:
-                        # If we had no deterministic citations, accept the LLM output
-                        final_answer = llm_text
-                        used_llm = True
-        except Exception:
-            # Fall back to deterministic
-            used_llm = False
-            final_answer = deterministic_answer
-
-    return {
+    result = {
         "question": query,
         "intent": rq.intent,
         "entity": rq.entity,
-        "used_llm": used_llm,
-        "answer": final_answer,
-        "citations": det_citations,
+        "used_llm": False,
+        "answer": out["answer"],
+        "citations": out["citations"],
         "retrieved": retrieved,
     }
+    return result, out["facts"]
+
+
+def _apply_llm_answer(result: Dict[str, Any], llm_text: str) -> None:
+    det_citations = result["citations"]
+
+    # Guardrails:
+    # 1) Must include a Source: line with at least one FHIR resource id
+    # 2) Must not introduce new/unknown FHIR ids (reduce hallucinated citations)
+    if llm_text and "Source:" in llm_text:
+        cited_set = frozenset(_CITATION_RE.findall(llm_text))
+        if cited_set:
+            if det_citations:
+                if cited_set.issubset(frozenset(det_citations)):
+                    result["answer"] = llm_text
+                    result["used_llm"] = True
+            else:
+                # If we had no deterministic citations, accept the LLM output
+                result["answer"] = llm_text
+                result["used_llm"] = True
@@ -2,9 +2,11 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
 
-@dataclass
+# Frozen so the memoized instances returned by route() cannot be mutated by callers.
+@dataclass(frozen=True)
 class RoutedQuery:
     intent: str
     entity: str
@@ -14,70 +16,67 @@ class RoutedQuery:
 # NOTE: Use word-boundary regex to avoid substring false positives like:
 # - "hypertension" triggering "er"
 # - "available" triggering "lab"
-_PAT_ALLERGY = re.compile(r"\b(allergy|allergies|allergic|anaphylaxis|rash|hives)\b", re.IGNORECASE)
-
-_PAT_ENCOUNTER = re.compile(
-    r"\b(encounter|visit|appointment)\b|\burgent\s+care\b|\bemergency\s+room\b|\ber\b",
-    re.IGNORECASE,
-)
-
-_PAT_LABS = re.compile(
-    r"\b(lab|labs|result|results|observation|loinc|creatinine|egfr|bun|renal|kidney|a1c|hba1c)\b",
-    re.IGNORECASE,
+#
+# All keyword families are unioned into one pattern with a named group each, so
+# route() scans the query once. Order matters where families share a prefix:
+# "allergy" must be tried before the bare "allerg" stem.
+_ROUTE_GROUPS = (
+    ("avoid", r"\bavoid\w*\b|\bcontraindicat\w*\b"),
+    ("complication", r"\bcomplication(s)?\b"),
+    ("diabetes", r"\b(diabetes|diabetic)\b"),
+    ("allergy", r"\b(allergy|allergies|allergic|anaphylaxis|rash|hives)\b"),
+    ("allergy_stem", r"\ballerg\w*"),
+    ("encounter", r"\b(encounter|visit|appointment)\b|\burgent\s+care\b|\bemergency\s+room\b|\ber\b"),
+    ("labs", r"\b(lab|labs|result|results|observation|loinc|creatinine|egfr|bun|renal|kidney|a1c|hba1c)\b"),
+    ("medication", r"\b(medication|medications|drug|drugs|prescription|taking)\b"),
+    (
+        "condition",
+        r"\b(diagnosis|condition|history\s+of|diagnosed\s+with|does\s+the\s+patient\s+have|do\s+they\s+have)\b",
+    ),
 )
+_PAT_ROUTE = re.compile("|".join(f"(?P<{name}>{pat})" for name, pat in _ROUTE_GROUPS), re.IGNORECASE)
 
-_PAT_MED = re.compile(r"\b(medication|medications|drug|drugs|prescription|taking)\b", re.IGNORECASE)
-
-_PAT_CONDITION = re.compile(
-    r"\b(diagnosis|condition|history\s+of|diagnosed\s+with|does\s+the\s+patient\s+have|do\s+they\s+have)\b",
-    re.IGNORECASE,
-)
+# Entity extraction (see _extract_entity)
+_PAT_ENTITY_HAVE = re.compile(r"(?:have|diagnosed\s+with)\s+([a-z0-9\-\s]+?)(\?|\.|,|$)")
+_PAT_ENTITY_FOR = re.compile(r"for\s+([a-z0-9\-\s]+?)(\?|\.|,|$)")
 
 
+@lru_cache(maxsize=1024)
 def route(query: str) -> RoutedQuery:
     q = query.strip()
     ql = q.lower()
     entity = _extract_entity(ql)
 
+    fired = set()
+    for m in _PAT_ROUTE.finditer(ql):
+        fired.add(m.lastgroup)
+        if m.lastgroup == "allergy" and m.group().startswith("allerg"):
+            fired.add("allergy_stem")
+
     # Medication safety / reconciliation
-    if re.search(r"\bavoid\w*\b|\bcontraindicat\w*\b", ql) and re.search(r"\ballerg", ql):
+    if "avoid" in fired and "allergy_stem" in fired:
         return RoutedQuery(intent="avoid_allergies", entity=entity, raw=query)
 
     # Diabetes complications
-    if re.search(r"\bcomplication(s)?\b", ql) and re.search(r"\b(diabetes|diabetic)\b", ql):
+    if "complication" in fired and "diabetes" in fired:
         return RoutedQuery(intent="diabetes_complications", entity=entity, raw=query)
 
-    # Allergies
-    if _PAT_ALLERGY.search(ql):
-        return RoutedQuery(intent="allergy", entity=entity, raw=query)
-
-    # Encounters
-    if _PAT_ENCOUNTER.search(ql):
-        return RoutedQuery(intent="encounter", entity=entity, raw=query)
-
-    # Labs / Observations
-    if _PAT_LABS.search(ql):
-        return RoutedQuery(intent="labs", entity=entity, raw=query)
-
-    # Medications
-    if _PAT_MED.search(ql):
-        return RoutedQuery(intent="medication", entity=entity, raw=query)
-
-    # Conditions
-    if _PAT_CONDITION.search(ql):
-        return RoutedQuery(intent="condition", entity=entity, raw=query)
+    # Single-family intents, in precedence order
+    for intent in ("allergy", "encounter", "labs", "medication", "condition"):
+        if intent in fired:
+            return RoutedQuery(intent=intent, entity=entity, raw=query)
 
     return RoutedQuery(intent="fallback", entity=entity, raw=query)
 
 
 def _extract_entity(ql: str) -> str:
     # "have asthma", "diagnosed with asthma"
-    m = re.search(r"(?:have|diagnosed\s+with)\s+([a-z0-9\-\s]+?)(\?|\.|,|$)", ql)
+    m = _PAT_ENTITY_HAVE.search(ql)
     if m:
         return m.group(1).strip()
 
     # "taking for hypertension"
-    m = re.search(r"for\s+([a-z0-9\-\s]+?)(\?|\.|,|$)", ql)
+    m = _PAT_ENTITY_FOR.search(ql)
     if m:
         return m.group(1).strip()
 
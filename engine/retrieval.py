@@ -1,54 +1,189 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
 
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
 
 from .types import Chunk
 
+# sklearn is imported where it is used: it is the slowest import in the engine
+# and only index building / query vectorization need it.
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+# sparse_dot_topn is an optional fast path: fused sparse matmul + top-n in C++.
+try:
+    from sparse_dot_topn import sp_matmul_topn
+except ImportError:
+    sp_matmul_topn = None
+
+# Below this many chunks a full sparse product is already cheap and exact.
+_TOPN_MIN_CHUNKS = 50_000
+# Hits kept (top_k * factor) so ties at the top_k cut-off rank like the exact path.
+_TOPN_POOL_FACTOR = 4
+
 
 @dataclass
 class HybridTfidfIndex:
     chunks: List[Chunk]
-    vec_word: TfidfVectorizer
-    vec_char: TfidfVectorizer
-    mat_word: np.ndarray
-    mat_char: np.ndarray
+    # Stateless hashing vectorizers; no vocabulary dict to pickle.
+    vec_word: HashingVectorizer
+    vec_char: HashingVectorizer
+    # 1 x n_features CSR rows (float32) holding the IDF of features seen in the
+    # corpus only (see _fit_tfidf); every other feature weighs 0.
+    idf_word: sparse.csr_matrix
+    idf_char: sparse.csr_matrix
+    # Sparse CSR (float32) over [word | char] hashed features. Each half is
+    # L2-normalized and scaled by sqrt(alpha) / sqrt(1 - alpha) at build time,
+    # so one sparse product with an identically weighted query gives the
+    # hybrid score alpha * cos_word + (1 - alpha) * cos_char.
+    mat: sparse.csr_matrix
+    # Baked into `mat`; changing it requires rebuilding the index.
     alpha: float = 0.7
 
-    def search(self, query: str, top_k: int = 8) -> List[Tuple[Chunk, float]]:
-        qw = self.vec_word.transform([query]).toarray().astype(np.float32)[0]
-        qc = self.vec_char.transform([query]).toarray().astype(np.float32)[0]
+    def _query_matrix(self, queries: List[str]) -> sparse.csr_matrix:
+        qw = _tfidf_rows(self.vec_word.transform(queries), self.idf_word)
+        qc = _tfidf_rows(self.vec_char.transform(queries), self.idf_char)
+        return _weighted_hstack(qw, qc, self.alpha)
 
-        sw = cosine_sim(self.mat_word, qw)
-        sc = cosine_sim(self.mat_char, qc)
+    def _scores(self, queries: List[str]) -> np.ndarray:
+        # [N_chunks, len(queries)] hybrid cosine scores.
+        return (self.mat @ self._query_matrix(queries).T).toarray()
 
-        sims = self.alpha * sw + (1.0 - self.alpha) * sc
-        idx = np.argsort(-sims)[:top_k]
+    def search(self, query: str, top_k: int = 8) -> List[Tuple[Chunk, float]]:
+        if sp_matmul_topn is not None and len(self.chunks) >= _TOPN_MIN_CHUNKS and top_k > 0:
+            hits = self._search_topn(query, top_k)
+            if hits is not None:
+                return hits
+
+        sims = self._scores([query])[:, 0]
+        idx = top_k_indices(sims, top_k)
         return [(self.chunks[int(i)], float(sims[int(i)])) for i in idx]
 
+    def search_batch(self, queries: List[str], top_k: int = 8) -> List[List[Tuple[Chunk, float]]]:
+        """Score all queries with one sparse matrix product ([N, B] scores)."""
+        if not queries:
+            return []
+        sims = self._scores(queries)
 
-def build_hybrid_tfidf(chunks: List[Chunk]) -> HybridTfidfIndex:
-    texts = [c.text for c in chunks]
-    vec_word = TfidfVectorizer(stop_words="english", max_features=60000)
-    vec_char = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), max_features=80000)
+        out: List[List[Tuple[Chunk, float]]] = []
+        for j in range(sims.shape[1]):
+            col = sims[:, j]
+            out.append([(self.chunks[int(i)], float(col[int(i)])) for i in top_k_indices(col, top_k)])
+        return out
 
-    mat_word = vec_word.fit_transform(texts).toarray().astype(np.float32)
-    mat_char = vec_char.fit_transform(texts).toarray().astype(np.float32)
+    def _search_topn(self, query: str, top_k: int) -> Optional[List[Tuple[Chunk, float]]]:
+        """
+        Top hybrid scores via sparse_dot_topn (no N-long score vector). The
+        fused matrix makes its scores exact; a wider pool is kept so ties at
+        the cut-off are ranked by top_k_indices like the full path. Returns
+        None when too few chunks match, so the caller's exact path supplies
+        the zero-score tail in the usual order.
+        """
+        top = sp_matmul_topn(self._query_matrix([query]), self._transposed(), top_n=top_k * _TOPN_POOL_FACTOR)
+        if top.nnz < top_k:
+            return None
+
+        order = np.argsort(top.indices, kind="stable")
+        rows, sims = top.indices[order], top.data[order]
+        return [(self.chunks[int(rows[i])], float(sims[i])) for i in top_k_indices(sims, top_k)]
+
+    def _transposed(self) -> sparse.csr_matrix:
+        # [V, N] CSR copy for sparse_dot_topn, built on first use and not persisted.
+        if "_mat_t" not in self.__dict__:
+            self.__dict__["_mat_t"] = self.mat.T.tocsr()
+        return self.__dict__["_mat_t"]
+
+
+def build_hybrid_tfidf(chunks: List[Chunk], alpha: float = 0.7) -> HybridTfidfIndex:
+    texts = [c.text for c in chunks]
+    vec_word, idf_word, mat_word = _fit_tfidf(texts, stop_words="english")
+    vec_char, idf_char, mat_char = _fit_tfidf(texts, analyzer="char_wb", ngram_range=(3, 5))
 
     return HybridTfidfIndex(
         chunks=chunks,
         vec_word=vec_word,
         vec_char=vec_char,
-        mat_word=mat_word,
-        mat_char=mat_char,
-        alpha=0.7,
+        idf_word=idf_word,
+        idf_char=idf_char,
+        mat=_weighted_hstack(mat_word, mat_char, alpha),
+        alpha=alpha,
+    )
+
+
+def _weighted_hstack(word: sparse.csr_matrix, char: sparse.csr_matrix, alpha: float) -> sparse.csr_matrix:
+    # Scaling both the index and the query halves by sqrt(weight) makes their
+    # dot product the alpha-weighted sum of the two cosines.
+    return sparse.hstack(
+        [word * np.float32(np.sqrt(alpha)), char * np.float32(np.sqrt(1.0 - alpha))],
+        format="csr",
+        dtype=np.float32,
+    )
+
+
+# Hash buckets per vectorizer; collisions stay rare at this corpus vocabulary size.
+_HASH_FEATURES = 2**18
+
+
+def _fit_tfidf(texts: List[str], **hashing_kwargs: Any) -> Tuple[HashingVectorizer, sparse.csr_matrix, sparse.csr_matrix]:
+    """
+    Same weighting as TfidfVectorizer, but terms are hashed instead of kept in a
+    vocabulary, so the only fitted state is the IDF of the features that occur.
+
+    Returns the hashing vectorizer, the sparse IDF row and the L2-normalized
+    float32 CSR matrix for `texts`.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+    hv = HashingVectorizer(n_features=_HASH_FEATURES, alternate_sign=False, norm=None, **hashing_kwargs)
+    counts = hv.transform(texts)
+    idf = TfidfTransformer().fit(counts).idf_
+    seen = np.flatnonzero(np.bincount(counts.indices, minlength=_HASH_FEATURES)).astype(np.int32)
+    idf_row = sparse.csr_matrix(
+        (idf[seen].astype(np.float32), seen, np.array([0, seen.size], dtype=np.int32)),
+        shape=(1, _HASH_FEATURES),
     )
+    return hv, idf_row, _tfidf_rows(counts, idf_row)
+
+
+def _tfidf_rows(counts: sparse.csr_matrix, idf: sparse.csr_matrix) -> sparse.csr_matrix:
+    # IDF-weight hashed term counts and L2-normalize each row (cosine scoring is
+    # then one sparse product). Features absent from `idf` get weight 0, so a
+    # query term never seen in the corpus is ignored as with a vocabulary.
+    from sklearn.preprocessing import normalize
+
+    counts = counts.astype(np.float32)
+    counts.data *= _idf_at(idf, counts.indices)
+    counts.eliminate_zeros()
+    return normalize(counts, norm="l2", copy=False)
+
+
+def _idf_at(idf: sparse.csr_matrix, cols: np.ndarray) -> np.ndarray:
+    seen = idf.indices  # sorted feature ids with a fitted IDF
+    if seen.size == 0:
+        return np.zeros(cols.shape, dtype=np.float32)
+    pos = np.minimum(np.searchsorted(seen, cols), seen.size - 1)
+    return np.where(seen[pos] == cols, idf.data[pos], np.float32(0))
+
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first: O(N) partition + O(k log k) sort.
 
-def cosine_sim(M: np.ndarray, q: np.ndarray) -> np.ndarray:
-    qn = float(np.linalg.norm(q) + 1e-12)
-    Mn = np.linalg.norm(M, axis=1) + 1e-12
-    return (M @ q) / (Mn * qn)
+    Ties are broken by position (earlier chunk first), exactly like a stable
+    full argsort, so results do not depend on argpartition's internal order.
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k == n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    kth = scores[part].min()
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[: k - above.shape[0]]
+    idx = np.concatenate([above, ties])
+    return idx[np.argsort(-scores[idx], kind="stable")]
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import re
+import warnings
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .codes import coding_label
+from .types import Normalized
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Substring lookups go through character n-grams of the indexed tokens up to this length.
+_GRAM = 3
+
+# table -> (text fields to index, date fields in fallback order)
+_TABLE_FIELDS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "conditions": (("text",), ("recorded",)),
+    "medications": (("text", "reason"), ("effective",)),
+    "observations": (("text",), ("effective", "issued")),
+    "allergies": (("text",), ()),
+    "encounters": (("type", "reason"), ("start",)),
+}
+
+
+@dataclass
+class RowIndex:
+    """
+    Per-table lookup structures built once with the index, so handlers can
+    narrow rows by token or code instead of scanning every record per query.
+    """
+
+    timestamps: np.ndarray  # epoch seconds per row (first non-empty date field), -1 if missing
+    token_index: Dict[str, Set[int]]  # lowercased token from text fields + codings -> row positions
+    icd10_prefix_index: Dict[str, Set[int]]  # first 3 chars of ICD-10 codes, e.g. "E11" -> row positions
+    gram_index: Dict[str, Set[str]]  # 1- to 3-char substring -> indexed tokens containing it
+
+    def candidates(self, needle: str) -> Optional[Set[int]]:
+        """
+        Rows that may contain `needle` (lowercased) as a substring of an indexed
+        field. This is a superset: callers still check the actual field.
+        Returns None when the needle has no word characters to narrow by.
+        """
+        toks = set(_TOKEN_RE.findall(needle.lower()))
+        if not toks:
+            return None
+        out: Optional[Set[int]] = None
+        for t in toks:
+            # A needle token may sit inside a longer indexed token ("asthma" in "asthmatic").
+            rows: Set[int] = set()
+            for vocab in self._tokens_containing(t):
+                rows |= self.token_index[vocab]
+            out = rows if out is None else out & rows
+            if not out:
+                break
+        return out
+
+    def _tokens_containing(self, t: str) -> Set[str]:
+        # Short needles are keys of the gram index; longer ones are filtered from
+        # the tokens sharing their rarest trigram.
+        if len(t) <= _GRAM:
+            return self.gram_index.get(t, set())
+        pool: Optional[Set[str]] = None
+        for i in range(len(t) - _GRAM + 1):
+            vocab = self.gram_index.get(t[i : i + _GRAM])
+            if not vocab:
+                return set()
+            if pool is None or len(vocab) < len(pool):
+                pool = vocab
+        return {v for v in pool if t in v}
+
+    def icd10_rows(self, prefixes: Iterable[str]) -> Set[int]:
+        out: Set[int] = set()
+        for p in prefixes:
+            out |= self.icd10_prefix_index.get(p.upper(), set())
+        return out
+
+    def newest_first(self, positions: Iterable[int]) -> List[int]:
+        # Stable, so rows with equal/missing dates keep their order.
+        pos = np.fromiter(positions, dtype=np.int64)
+        return pos[np.argsort(-self.timestamps[pos], kind="stable")].tolist()
+
+
+def build_row_indexes(norm: Normalized) -> Dict[str, RowIndex]:
+    return {
+        table: build_row_index(getattr(norm, table), text_fields, date_fields)
+        for table, (text_fields, date_fields) in _TABLE_FIELDS.items()
+    }
+
+
+def build_row_index(rows: Sequence[Dict[str, Any]], text_fields: Sequence[str], date_fields: Sequence[str]) -> RowIndex:
+    token_index: Dict[str, Set[int]] = defaultdict(set)
+    icd10_prefix_index: Dict[str, Set[int]] = defaultdict(set)
+    dates: List[Any] = []
+
+    for i, r in enumerate(rows):
+        parts = [str(r.get(f) or "") for f in text_fields]
+        parts.extend(r.get("codings") or [])
+        for tok in _TOKEN_RE.findall(" ".join(parts).lower()):
+            token_index[tok].add(i)
+
+        for system, code, _display in r.get("parsedCodings") or []:
+            if code and coding_label(system) == "ICD-10":
+                icd10_prefix_index[code.upper()[:3]].add(i)
+
+        dates.append(next((r.get(f) for f in date_fields if r.get(f)), None))
+
+    gram_index: Dict[str, Set[str]] = defaultdict(set)
+    for tok in token_index:
+        for n in range(1, _GRAM + 1):
+            for i in range(len(tok) - n + 1):
+                gram_index[tok[i : i + n]].add(tok)
+
+    return RowIndex(
+        timestamps=epoch_seconds(dates),
+        token_index=dict(token_index),
+        icd10_prefix_index=dict(icd10_prefix_index),
+        gram_index=dict(gram_index),
+    )
+
+
+def epoch_seconds(values: Sequence[Any]) -> np.ndarray:
+    """
+    Epoch seconds (int64) for ISO-8601 date strings; -1 where missing or unparseable.
+
+    Values are normalized ISO strings (see normalize._best_date), so numpy can
+    parse the whole column at once; dateutil is only used for odd values.
+    """
+    strs = [v if isinstance(v, str) else "" for v in values]
+    with warnings.catch_warnings():
+        # numpy converts "+HH:MM" offsets to UTC but warns that it does so.
+        warnings.simplefilter("ignore")
+        try:
+            arr = np.array(strs, dtype="datetime64[s]")
+        except ValueError:
+            arr = np.array([_parse_datetime64(v) for v in strs], dtype="datetime64[s]")
+    ts = arr.view("i8").copy()
+    ts[np.isnat(arr)] = -1
+    return ts
+
+
+def _parse_datetime64(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(value, "s")
+    except ValueError:
+        pass
+    from dateutil import parser as dtparser  # only needed for non-ISO values
+
+    try:
+        dt = dtparser.parse(value)
+    except Exception:
+        return np.datetime64("NaT")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(dt, "s")